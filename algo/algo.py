@@ -1,16 +1,72 @@
 import heapq
 import math
+import time
 from itertools import product
 from typing import List
 import numpy as np
 from entities.Robot import Robot
 from entities.Entity import Obstacle, CellState, Grid
-from consts import Direction, MOVE_DIRECTION, TURN_FACTOR, ITERATIONS, TURN_RADIUS, SAFE_COST
+from consts import Direction, MOVE_DIRECTION, ITERATIONS, TURN_RADIUS, SAFE_COST, EXPANDED_CELL, CELL_SIZE
 from python_tsp.exact import solve_tsp_dynamic_programming
+from algo.cost_model import CostModel, HEADING, MOVE_KINDS, move_kind
 
 turn_wrt_big_turns = [[3 * TURN_RADIUS, TURN_RADIUS],
                   [4 * TURN_RADIUS, 2 * TURN_RADIUS]]
 
+# Number of points sampled along a turn arc, per CELL_SIZE cell of scale
+TURN_SAMPLES = 8
+
+
+def robot_footprint(scale: int = 1) -> List[tuple]:
+    """Robot footprint, as cell offsets from its center (3x3 at CELL_SIZE cells)
+
+    Args:
+        scale: Cells per CELL_SIZE cm (see Grid)
+    """
+    half = EXPANDED_CELL * scale
+    return [(dx, dy) for dx in range(-half, half + 1) for dy in range(-half, half + 1)]
+
+
+def turn_arc(big_turn: int, direction: Direction, new_direction: Direction, reverse: bool,
+             scale: int = 1) -> List[tuple]:
+    """Robot center offsets sampled along a 90 degree turn, from its start (excluded) to its end
+
+    A forward turn moves `smaller` cells along the old heading and `bigger` along the new one, a reverse turn
+    -`bigger` along the old heading and -`smaller` along the new one. The arc in between is a quarter ellipse.
+
+    Args:
+        big_turn: Turn size (index into turn_wrt_big_turns)
+        direction: Heading before the turn
+        new_direction: Heading after the turn
+        reverse: True for a turn driven in reverse
+        scale: Cells per CELL_SIZE cm (see Grid), the turn sizes are multiplied by it
+
+    Returns:
+        List of TURN_SAMPLES * scale (dx, dy) offsets, the last one being the end of the turn
+    """
+    bigger, smaller = (size * scale for size in turn_wrt_big_turns[big_turn])
+    old_along, new_along = (-bigger, -smaller) if reverse else (smaller, bigger)
+    (ox, oy), (nx, ny) = HEADING[direction], HEADING[new_direction]
+    samples = TURN_SAMPLES * scale
+    arc = []
+    for k in range(1, samples + 1):
+        t = k / samples * math.pi / 2
+        a, b = old_along * math.sin(t), new_along * (1 - math.cos(t))
+        arc.append((round(ox * a + nx * b), round(oy * a + ny * b)))
+    return arc
+
+
+def turn_swept_cells(big_turn: int, direction: Direction, new_direction: Direction, reverse: bool,
+                     scale: int = 1) -> np.ndarray:
+    """Cells covered by the robot footprint during a turn, relative to its start position
+
+    Returns:
+        np.ndarray: (n, 2) unique (dx, dy) cell offsets, including the footprint at the start of the turn
+    """
+    centers = [(0, 0)] + turn_arc(big_turn, direction, new_direction, reverse, scale)
+    footprint = robot_footprint(scale)
+    return np.unique(np.array([(cx + fx, cy + fy) for cx, cy in centers for fx, fy in footprint]), axis=0)
+
 
 class MazeSolver:
     def __init__(
@@ -20,19 +76,41 @@ class MazeSolver:
             robot_x: int,
             robot_y: int,
             robot_direction: Direction,
-            big_turn=None # the big_turn here is to allow 3-1 turn(0 - by default) | 4-2 turn(1)
+            big_turn=None, # the big_turn here is to allow 3-1 turn(0 - by default) | 4-2 turn(1)
+            cost_model: CostModel = None, # cost of each move, abstract units by default (see algo/cost_model.py)
+            cell_size: int = CELL_SIZE # cm per grid cell, sizes and positions are in cells of this size
     ):
         # Initialize a Grid object for the arena representation
-        self.grid = Grid(size_x, size_y)
+        self.grid = Grid(size_x, size_y, cell_size)
         # Initialize a Robot object for robot representation
         self.robot = Robot(robot_x, robot_y, robot_direction)
         # Create tables for paths and costs
         self.path_table = dict()
         self.cost_table = dict()
+        # Counters and per-phase timings (seconds) collected while solving
+        self.stats = {
+            "astar_calls": 0,
+            "nodes_expanded": 0,
+            "heap_pushes": 0,
+            "combinations": 0,
+            "tsp_calls": 0,
+            "time_view_states": 0.0,
+            "time_pathfinding": 0.0,
+            "time_ordering": 0.0,
+        }
         if big_turn is None:
             self.big_turn = 0
         else:
             self.big_turn = int(big_turn)
+        self.cost_model = cost_model if cost_model is not None else CostModel()
+        # Costs are per CELL_SIZE cm, so a straight move of one smaller cell costs a fraction of one
+        scale = self.grid.scale
+        self.move_costs = {kind: self.cost_model.move_cost(kind) / (1 if kind.startswith("turn") else scale)
+                           for kind in MOVE_KINDS}
+        # A* heuristic cost per cell of Manhattan distance: a turn of this size covers bigger + smaller cells
+        self.heuristic_scale = self.cost_model.min_cell_cost(sum(turn_wrt_big_turns[self.big_turn])) / scale
+        # Swept turn collision masks, built on first use (see get_turn_masks)
+        self.turn_masks = None
 
     def add_obstacle(self, x: int, y: int, direction: Direction, obstacle_id: int):
         """Add obstacle to MazeSolver object
@@ -47,9 +125,43 @@ class MazeSolver:
         obstacle = Obstacle(x, y, direction, obstacle_id)
         # Add created obstacle to grid object
         self.grid.add_obstacle(obstacle)
+        self.turn_masks = None
 
     def reset_obstacles(self):
         self.grid.reset_obstacles()
+        self.turn_masks = None
+
+    def get_turn_masks(self) -> dict:
+        """Which start positions each turn primitive can be driven from without its swept area hitting an obstacle
+        or leaving the arena
+
+        The masks of all positions are computed at once, by shifting the occupancy grid by every swept cell of the
+        turn, so checking a turn during the search is a single lookup.
+
+        Returns:
+            dict: (direction, new_direction, reverse) -> size_x x size_y nested lists, True if the turn collides
+        """
+        if self.turn_masks is not None:
+            return self.turn_masks
+
+        size_x, size_y, scale = self.grid.size_x, self.grid.size_y, self.grid.scale
+        # Padded with occupied cells, wider than any swept offset, so turns leaving the arena collide
+        pad = (turn_wrt_big_turns[self.big_turn][0] + EXPANDED_CELL) * scale + 1
+        occupancy = np.ones((size_x + 2 * pad, size_y + 2 * pad), dtype=bool)
+        occupancy[pad:pad + size_x, pad:pad + size_y] = False
+        for ob in self.grid.obstacles:
+            occupancy[ob.x + pad, ob.y + pad] = True
+
+        self.turn_masks = {}
+        for direction, new_direction in product(HEADING, HEADING):
+            if Direction.rotation_cost(direction, new_direction) != 2:
+                continue
+            for reverse in (False, True):
+                blocked = np.zeros((size_x, size_y), dtype=bool)
+                for dx, dy in turn_swept_cells(self.big_turn, direction, new_direction, reverse, scale):
+                    blocked |= occupancy[pad + dx:pad + dx + size_x, pad + dy:pad + dy + size_y]
+                self.turn_masks[(direction, new_direction, reverse)] = blocked.tolist()
+        return self.turn_masks
 
     @staticmethod
     def compute_coord_distance(x1: int, y1: int, x2: int, y2: int, level: int = 1) -> float:
@@ -108,12 +220,33 @@ class MazeSolver:
         return s
 
     def get_optimal_order_dp(self, retrying) -> List[CellState]:
+        optimal_path, distance = [], 1e9
+        for event in self.iter_optimal_order_dp(retrying):
+            if event[0] == "order":
+                distance = event[1]
+            else:
+                optimal_path.extend(event[1])
+        return optimal_path, distance
+
+    def iter_optimal_order_dp(self, retrying):
+        """Solves the visit order like get_optimal_order_dp, then yields the path segment by segment
+
+        The order is only fixed once every view position combination has been searched; the segments are then
+        stitched from the A* paths one at a time, so a caller can act on the first one before the rest exist.
+
+        Yields:
+            ("order", distance, obstacle IDs in visit order) once, then ("segment", states) per visited obstacle:
+            the CellStates driven to its view position, the last one carrying its screenshot ID. The first
+            segment starts with the robot's start state. Nothing is yielded if no path is found.
+        """
         distance = 1e9
-        optimal_path = []
+        tour = []  # (from, to) view states of the best order found
 
         #print(f"Inside get_optimal_order_dp: retrying = {retrying}")
         # Get all possible positions that can view the obstacles
+        phase_start = time.perf_counter()
         all_view_positions = self.grid.get_view_obstacle_positions(retrying)
+        self.stats["time_view_states"] += time.perf_counter() - phase_start
         #print(f"all_view_positions: {all_view_positions}")
         #print(f"All view position: {all_view_positions}")
 
@@ -142,11 +275,15 @@ class MazeSolver:
                     #print("obstacle: {}\n".format(self.grid.obstacles[idx]))
 
             # Generate the path cost for the items
+            phase_start = time.perf_counter()
             self.path_cost_generator(items)
+            self.stats["time_pathfinding"] += time.perf_counter() - phase_start
+            phase_start = time.perf_counter()
             
             # Generate all combinations using itertools.product (more efficient)
             ranges = [range(len(vp)) for vp in cur_view_positions]
             combination = list(product(*ranges))[:ITERATIONS] if ranges else [[]]
+            self.stats["combinations"] += len(combination)
 
             for c in combination:
                 visited_candidates = [0] # add the start state of the robot
@@ -168,32 +305,43 @@ class MazeSolver:
                             cost_np[s][e] = self.cost_table[(u, v)]
                         else:
                             cost_np[s][e] = 1e9
-                        cost_np[e][s] = cost_np[s][e]
+                        if (v, u) in self.cost_table.keys():
+                            cost_np[e][s] = self.cost_table[(v, u)]
+                        else:
+                            cost_np[e][s] = 1e9
                 cost_np[:, 0] = 0
                 _permutation, _distance = solve_tsp_dynamic_programming(cost_np)
+                self.stats["tsp_calls"] += 1
                 # print(f"fixed_cost = {fixed_cost}")
                 # print(f"distance = {_distance}")
                 if _distance + fixed_cost >= distance:
                     continue
 
-                optimal_path = [items[0]]
                 distance = _distance + fixed_cost
+                tour = [(items[visited_candidates[_permutation[i]]], items[visited_candidates[_permutation[i + 1]]])
+                        for i in range(len(_permutation) - 1)]
 
-                for i in range(len(_permutation) - 1):
-                    from_item = items[visited_candidates[_permutation[i]]]
-                    to_item = items[visited_candidates[_permutation[i + 1]]]
+            self.stats["time_ordering"] += time.perf_counter() - phase_start
 
-                    cur_path = self.path_table[(from_item, to_item)]
-                    for j in range(1, len(cur_path)):
-                        optimal_path.append(CellState(cur_path[j][0], cur_path[j][1], cur_path[j][2]))
-
-                    optimal_path[-1].set_screenshot(to_item.screenshot_id)
-
-            if optimal_path:
+            if distance < 1e9:
                 # if found optimal path, return
                 break
 
-        return optimal_path, distance
+        if distance >= 1e9:
+            return
+        yield "order", distance, [to_item.screenshot_id for _, to_item in tour]
+
+        last = self.robot.get_start_state()
+        segment = [last]
+        for from_item, to_item in tour:
+            cur_path = self.path_table[(from_item, to_item)]
+            segment += [CellState(x, y, direction) for x, y, direction in cur_path[1:]]
+            last = segment[-1] if segment else last
+            last.set_screenshot(to_item.screenshot_id)
+            yield "segment", segment
+            segment = []
+        if not tour:
+            yield "segment", segment
 
     def get_safe_cost(self, x: int, y: int) -> int:
         """Get the safe cost of a particular x,y coordinate wrt obstacles that are exactly 2 units away.
@@ -205,21 +353,38 @@ class MazeSolver:
         Returns:
             SAFE_COST if too close to obstacle diagonally, 0 otherwise
         """
-        for ob in self.grid.obstacles:
+        scale = self.grid.scale
+        for ob in self.grid.obstacles_near(x, y):
             dx, dy = abs(ob.x - x), abs(ob.y - y)
             # Check if obstacle is diagonally close (within 2 units in both directions)
-            if (dx == 2 and dy == 2) or (dx == 1 and dy == 2) or (dx == 2 and dy == 1):
+            if scale < max(dx, dy) <= 2 * scale and min(dx, dy) >= scale:
                 return SAFE_COST
         return 0
 
+    def get_path_cost(self, path: List[tuple]) -> float:
+        """Cost of driving along a path of (x, y, direction) states, as computed by the A* search
+
+        Args:
+            path: List of (x, y, direction) tuples
+
+        Returns:
+            Sum of the move costs and the safe costs of every state after the first
+        """
+        cost = 0
+        for (x, y, direction), (nx, ny, nd) in zip(path, path[1:]):
+            cost += self.move_costs[move_kind(x, y, direction, nx, ny, nd)] + self.get_safe_cost(nx, ny)
+        return cost
+
     def get_neighbors(self, x: int, y: int, direction: Direction) -> List[tuple]:
         """
-        Return a list of tuples with format: (newX, newY, new_direction, safe_cost)
+        Return a list of tuples with format: (newX, newY, new_direction, move_cost)
         Neighbors are coordinates that are reachable via forward/backward movement or turns.
+        move_cost is the cost model's cost of the move plus the safe cost of the new position.
         """
         neighbors = []
-        bigger = turn_wrt_big_turns[self.big_turn][0]
-        smaller = turn_wrt_big_turns[self.big_turn][1]
+        turn_masks = self.get_turn_masks()
+        bigger = turn_wrt_big_turns[self.big_turn][0] * self.grid.scale
+        smaller = turn_wrt_big_turns[self.big_turn][1] * self.grid.scale
         
         # Turn displacement mapping: (current_dir, new_dir) -> [(dx1, dy1), (dx2, dy2)] for two turn options
         # Each turn has a forward turn and a backward turn option
@@ -240,15 +405,20 @@ class MazeSolver:
                 for sign in [1, -1]:
                     nx, ny = x + sign * dx, y + sign * dy
                     if self.grid.reachable(nx, ny):
-                        neighbors.append((nx, ny, md, self.get_safe_cost(nx, ny)))
+                        cost = self.move_costs["forward" if sign == 1 else "reverse"]
+                        neighbors.append((nx, ny, md, self.get_safe_cost(nx, ny) + cost))
             else:
                 # Turning movement
                 key = (direction, md)
                 if key in turn_map:
                     for turn_dx, turn_dy in turn_map[key]:
                         nx, ny = x + turn_dx, y + turn_dy
-                        if self.grid.reachable(nx, ny, turn=True) and self.grid.reachable(x, y, pre_turn=True):
-                            neighbors.append((nx, ny, md, self.get_safe_cost(nx, ny) + 10))
+                        kind = move_kind(x, y, direction, nx, ny, md)
+                        # The swept area mask checks the whole arc, reachable keeps the safety buffer at both ends
+                        if self.grid.reachable(nx, ny, turn=True) and self.grid.reachable(x, y, pre_turn=True) \
+                                and not turn_masks[(direction, md, kind == "turn_reverse")][x][y]:
+                            cost = self.move_costs[kind]
+                            neighbors.append((nx, ny, md, self.get_safe_cost(nx, ny) + cost))
         
         return neighbors
 
@@ -260,10 +430,6 @@ class MazeSolver:
         """
         def record_path(start, end, parent: dict, cost: int):
 
-            # Update cost table for the (start,end) and (end,start) edges
-            self.cost_table[(start, end)] = cost
-            self.cost_table[(end, start)] = cost
-
             path = []
             cursor = (end.x, end.y, end.direction)
 
@@ -273,6 +439,11 @@ class MazeSolver:
 
             path.append(cursor)
 
+            # Update cost table for the (start,end) and (end,start) edges. Driving the path backwards turns forward
+            # moves into reverse ones, so with an asymmetric cost model the (end,start) edge has its own cost
+            self.cost_table[(start, end)] = cost
+            self.cost_table[(end, start)] = cost if self.cost_model.symmetric else self.get_path_cost(path)
+
             # Update path table for the (start,end) and (end,start) edges, with the (start,end) edge being the reversed path
             self.path_table[(start, end)] = path[::-1]
             self.path_table[(end, start)] = path
@@ -284,6 +455,10 @@ class MazeSolver:
             if (start, end) in self.path_table:
                 return
 
+            self.stats["astar_calls"] += 1
+            nodes_expanded = 0
+            heap_pushes = 1
+
             # Heuristic to guide the search: 'distance' is calculated by f = g + h
             # g is the actual distance moved so far from the start node to current node
             # h is the heuristic distance from current node to end node
@@ -291,7 +466,9 @@ class MazeSolver:
 
             # format of each item in heap: (f_distance of node, x coord of node, y coord of node)
             # heap in Python is a min-heap
-            heap = [(self.compute_state_distance(start, end), start.x, start.y, start.direction)]
+            # The heuristic is scaled by the cheapest cost per cell so that it never overestimates
+            h_scale = self.heuristic_scale
+            heap = [(self.compute_state_distance(start, end) * h_scale, start.x, start.y, start.direction)]
             parent = dict()
             visited = set()
 
@@ -304,24 +481,23 @@ class MazeSolver:
 
                 if end.is_eq(cur_x, cur_y, cur_direction):
                     record_path(start, end, parent, g_distance[(cur_x, cur_y, cur_direction)])
-                    return
+                    break
 
                 visited.add((cur_x, cur_y, cur_direction))
+                nodes_expanded += 1
                 cur_distance = g_distance[(cur_x, cur_y, cur_direction)]
 
-                for next_x, next_y, new_direction, safe_cost in self.get_neighbors(cur_x, cur_y, cur_direction):
+                for next_x, next_y, new_direction, move_cost in self.get_neighbors(cur_x, cur_y, cur_direction):
                     if (next_x, next_y, new_direction) in visited:
                         continue
 
-                    move_cost = Direction.rotation_cost(new_direction, cur_direction) * TURN_FACTOR + 1 + safe_cost
-
                     # the cost to check if any obstacles that considered too near the robot; if it
                     # safe_cost =
 
                     # new cost is calculated by the cost to reach current state + cost to move from
                     # current state to new state + heuristic cost from new state to end state
                     next_cost = cur_distance + move_cost + \
-                                self.compute_coord_distance(next_x, next_y, end.x, end.y)
+                                self.compute_coord_distance(next_x, next_y, end.x, end.y) * h_scale
 
                     if (next_x, next_y, new_direction) not in g_distance or \
                             g_distance[(next_x, next_y, new_direction)] > cur_distance + move_cost:
@@ -329,11 +505,63 @@ class MazeSolver:
                         parent[(next_x, next_y, new_direction)] = (cur_x, cur_y, cur_direction)
 
                         heapq.heappush(heap, (next_cost, next_x, next_y, new_direction))
+                        heap_pushes += 1
+
+            self.stats["nodes_expanded"] += nodes_expanded
+            self.stats["heap_pushes"] += heap_pushes
 
         # Nested loop through all the state pairings
         for i in range(len(states) - 1):
             for j in range(i + 1, len(states)):
                 astar_search(states[i], states[j])
 
+def exhaustive_path_cost(maze_solver: MazeSolver, start: CellState, end: CellState) -> float:
+    """Cost of the cheapest path from start to end by uniform-cost search over every state, without a heuristic.
+    Reference for the A* search, whose heuristic must never overestimate
+
+    Returns:
+        float: Path cost, inf if end cannot be reached
+    """
+    best = {(start.x, start.y, start.direction): 0}
+    heap = [(0, start.x, start.y, start.direction)]
+    while heap:
+        cost, x, y, direction = heapq.heappop(heap)
+        if end.is_eq(x, y, direction):
+            return cost
+        if cost > best[(x, y, direction)]:
+            continue
+        for nx, ny, nd, move_cost in maze_solver.get_neighbors(x, y, direction):
+            if cost + move_cost < best.get((nx, ny, nd), math.inf):
+                best[(nx, ny, nd)] = cost + move_cost
+                heapq.heappush(heap, (cost + move_cost, nx, ny, nd))
+    return math.inf
+
+
 if __name__ == "__main__":
-    pass
+    # A* costs must match an exhaustive search, for every turn size and cost model
+    import random
+    from algo.cost_model import TimeCostModel
+
+    rng = random.Random(0)
+    # Cheap turns make the turn, not the straight move, the cheapest per cell, which the heuristic must allow for
+    cost_models = {"abstract": CostModel(), "calibrated": TimeCostModel(0.45, 0.5, 2.6, 2.9),
+                   "cheap turn": TimeCostModel(1.0, 1.0, 3.0, 3.0)}
+    for big_turn, (name, cost_model), cell_size in product((0, 1), cost_models.items(), (CELL_SIZE, CELL_SIZE // 2)):
+        scale = CELL_SIZE // cell_size
+        checked = 0
+        for _ in range(4):
+            maze_solver = MazeSolver(16 * scale, 16 * scale, scale, scale, Direction.NORTH, big_turn=big_turn,
+                                     cost_model=cost_model, cell_size=cell_size)
+            for obstacle_id in range(1, 3):
+                maze_solver.add_obstacle(rng.randrange(4, 15) * scale, rng.randrange(4, 15) * scale,
+                                         rng.choice((Direction.NORTH, Direction.EAST, Direction.SOUTH,
+                                                     Direction.WEST)), obstacle_id)
+            start = maze_solver.robot.get_start_state()
+            for end in [state for states in maze_solver.grid.get_view_obstacle_positions(False) for state in states]:
+                maze_solver.path_cost_generator([start, end])
+                exhaustive = exhaustive_path_cost(maze_solver, start, end)
+                astar = maze_solver.cost_table.get((start, end), math.inf)
+                assert math.isclose(astar, exhaustive) or astar == exhaustive, \
+                    f"A* cost {astar} != exhaustive {exhaustive} (big_turn {big_turn}, {name}, {cell_size} cm)"
+                checked += 1
+        print(f"big_turn {big_turn}, {name} costs, {cell_size} cm cells: {checked} A* paths optimal")
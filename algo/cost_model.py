@@ -0,0 +1,114 @@
+import json
+from typing import List
+from consts import Direction, TURN_FACTOR
+
+# Direction -> (dx, dy) of a forward step, used to tell forward moves/turns from reverse ones
+HEADING = {
+    Direction.NORTH: (0, 1),
+    Direction.EAST: (1, 0),
+    Direction.SOUTH: (0, -1),
+    Direction.WEST: (-1, 0),
+}
+
+MOVE_KINDS = ("forward", "reverse", "turn_forward", "turn_reverse")
+
+
+def move_kind(x: int, y: int, direction: Direction, new_x: int, new_y: int, new_direction: Direction) -> str:
+    """Classifies a move between two robot states
+
+    Returns:
+        str: 'forward'/'reverse' for straight moves, 'turn_forward'/'turn_reverse' for turns, depending on whether
+        the robot moved along or against its starting heading
+    """
+    dx, dy = HEADING.get(direction, (0, 0))
+    along = (new_x - x) * dx + (new_y - y) * dy > 0
+    if new_direction == direction:
+        return "forward" if along else "reverse"
+    return "turn_forward" if along else "turn_reverse"
+
+
+class CostModel:
+    """
+    Abstract planner costs: 1 per cell moved, TURN_FACTOR x rotation + 1 + 10 per 90 degree turn.
+
+    Costs have no unit, so no run duration can be predicted.
+    """
+
+    def __init__(self):
+        turn = Direction.rotation_cost(Direction.NORTH, Direction.EAST) * TURN_FACTOR + 1 + 10
+        self.costs = {"forward": 1, "reverse": 1, "turn_forward": turn, "turn_reverse": turn}
+
+    @property
+    def symmetric(self) -> bool:
+        """True if driving a path backwards costs the same as driving it forwards"""
+        return self.costs["forward"] == self.costs["reverse"] and \
+            self.costs["turn_forward"] == self.costs["turn_reverse"]
+
+    def move_cost(self, kind: str):
+        """Cost of a single move of the given kind (see move_kind)"""
+        return self.costs[kind]
+
+    def min_cell_cost(self, turn_cells: int) -> float:
+        """Lower bound of the cost per CELL_SIZE cell of Manhattan distance, scales the A* heuristic
+
+        Args:
+            turn_cells: Manhattan distance a turn covers, in CELL_SIZE cells (depends on the solver's big_turn)
+        """
+        # A turn covers turn_cells cells, so it never costs less than its cost / turn_cells per cell
+        return min(self.costs["forward"], self.costs["reverse"], self.costs["turn_forward"] / turn_cells,
+                   self.costs["turn_reverse"] / turn_cells)
+
+    def estimate_duration(self, states: list, scale: int = 1):
+        """Predicted run time of a path in seconds, None if the model is not calibrated
+
+        Args:
+            states: Path states
+            scale: Cells per CELL_SIZE cm of the grid the path is on (see Grid)
+        """
+        return None
+
+
+class TimeCostModel(CostModel):
+    """
+    Costs in seconds, from a calibration of the robot: time per 10 cm forward and reverse, time per forward and
+    reverse 90 degree turn, and the dwell time at each SNAP. The planner then minimises the expected mission time.
+    """
+
+    def __init__(self, forward: float, reverse: float, turn_forward: float, turn_reverse: float,
+                 snap_dwell: float = 0.0):
+        """
+        Args:
+            forward: Seconds per 10 cm forward
+            reverse: Seconds per 10 cm in reverse
+            turn_forward: Seconds per forward 90 degree turn
+            turn_reverse: Seconds per reverse 90 degree turn
+            snap_dwell: Seconds stopped at each SNAP
+        """
+        super().__init__()
+        self.costs = {"forward": forward, "reverse": reverse, "turn_forward": turn_forward,
+                      "turn_reverse": turn_reverse}
+        self.snap_dwell = snap_dwell
+
+    @classmethod
+    def from_file(cls, path: str) -> "TimeCostModel":
+        """Loads a calibration file
+
+        Args:
+            path: JSON file with keys forward, reverse, turn_forward, turn_reverse and optionally snap_dwell
+
+        Returns:
+            TimeCostModel
+        """
+        with open(path) as f:
+            calibration = json.load(f)
+        return cls(**{key: calibration[key] for key in MOVE_KINDS}, snap_dwell=calibration.get("snap_dwell", 0.0))
+
+    def estimate_duration(self, states: List, scale: int = 1) -> float:
+        duration = 0.0
+        for prev, cur in zip(states, states[1:]):
+            kind = move_kind(prev.x, prev.y, prev.direction, cur.x, cur.y, cur.direction)
+            # Straight moves are timed per CELL_SIZE cm, turns as a whole
+            duration += self.costs[kind] / (1 if kind.startswith("turn") else scale)
+            if cur.screenshot_id != -1:
+                duration += self.snap_dwell
+        return duration
@@ -0,0 +1,163 @@
+from typing import List
+import numpy as np
+from algo.algo import TURN_SAMPLES, robot_footprint, turn_arc
+from algo.cost_model import HEADING
+from consts import Direction, WIDTH, HEIGHT, CELL_SIZE
+from entities.Entity import Grid
+from helper import OPCODES, parse_command
+
+_HEADINGS = [Direction.NORTH, Direction.EAST, Direction.SOUTH, Direction.WEST]
+
+
+def _turn_table(big_turn: int, scale: int = 1) -> np.ndarray:
+    """Center offsets sampled along every turn (see turn_arc), indexed by [heading index, op is TURN90R, reverse]
+
+    Returns:
+        np.ndarray: (4, 2, 2, TURN_SAMPLES * scale, 2) int offsets, the last sample being the end of the turn
+    """
+    table = np.zeros((4, 2, 2, TURN_SAMPLES * scale, 2), dtype=int)
+    for h, heading in enumerate(_HEADINGS):
+        for right in (0, 1):
+            for reverse in (0, 1):
+                # Steering right turns the robot clockwise going forward and anticlockwise in reverse
+                clockwise = right != reverse
+                new_heading = _HEADINGS[(h + (1 if clockwise else 3)) % 4]
+                table[h, right, reverse] = turn_arc(big_turn, heading, new_heading, bool(reverse), scale)
+    return table
+
+
+def _occupancy(obstacles, size_x: int, size_y: int) -> np.ndarray:
+    """Occupancy grid of an arena, with a 1 cell wall around it so footprints leaving the arena collide
+
+    Args:
+        obstacles: Grid, or list of obstacle dicts ('x', 'y') as sent to /path
+    """
+    if isinstance(obstacles, Grid):
+        obstacles = [{'x': ob.x, 'y': ob.y} for ob in obstacles.get_obstacles()]
+    occupancy = np.ones((size_x + 2, size_y + 2), dtype=bool)
+    occupancy[1:-1, 1:-1] = False
+    for ob in obstacles:
+        occupancy[ob['x'] + 1, ob['y'] + 1] = True
+    return occupancy
+
+
+def simulate(plans: List[list], obstacles: list, start: tuple = (1, 1, Direction.NORTH), big_turn: int = 0,
+             time_model=None, size_x: int = WIDTH, size_y: int = HEIGHT, cell_size: int = CELL_SIZE) -> dict:
+    """Executes a batch of command streams against their arenas, all plans stepping in lockstep with numpy
+
+    Straight moves are checked cell by cell and turns at TURN_SAMPLES points along their arc, with the robot's
+    footprint (3x3 at CELL_SIZE cells) against the obstacles and the arena walls. A plan stops at its first collision.
+
+    Plans can be protocol strings (command_generator output) or Command records (iter_command_records). The
+    protocol strings do not say whether a turn is driven in reverse, so string plans are simulated with forward
+    turns only; pass records to simulate reverse turns.
+
+    Args:
+        plans: List of command streams
+        obstacles: Grid or list of obstacle dicts ('x', 'y') shared by all plans, or a list with one of those per plan
+        start: (x, y, direction) start pose, shared by all plans
+        big_turn: Turn size, as in MazeSolver
+        time_model: TimeCostModel used to estimate the travel time, NaN if None
+        size_x: Arena width in cells
+        size_y: Arena height in cells
+        cell_size: Size of a cell in cm, the length of one straight step
+
+    Returns:
+        dict of arrays over the batch: x, y, direction (final pose), collided, collision_command (index of the
+        command that collided, -1 if none), travel_time; and snaps: per plan, a list of (label, x, y, direction)
+    """
+    batch = len(plans)
+    plans = [[parse_command(c) if isinstance(c, str) else c for c in plan] for plan in plans]
+    length = max((len(plan) for plan in plans), default=0)
+
+    # Commands as padded arrays, op 0 being a no-op
+    ops = np.zeros((batch, length), dtype=int)
+    values = np.zeros((batch, length), dtype=int)
+    reverse = np.zeros((batch, length), dtype=bool)
+    for b, plan in enumerate(plans):
+        for k, command in enumerate(plan):
+            ops[b, k] = OPCODES[command.op]
+            values[b, k] = command.value
+            reverse[b, k] = command.reverse
+
+    if isinstance(obstacles, Grid) or not obstacles or isinstance(obstacles[0], dict):
+        obstacles = [obstacles] * batch
+    occupancy = np.stack([_occupancy(obs, size_x, size_y) for obs in obstacles]) if batch else \
+        np.zeros((0, size_x + 2, size_y + 2), dtype=bool)
+    scale = CELL_SIZE // cell_size
+    footprint = np.array(robot_footprint(scale))
+    turns = _turn_table(big_turn, scale)
+    heading_vectors = np.array([HEADING[heading] for heading in _HEADINGS])
+
+    rows = np.arange(batch)
+    x = np.full(batch, start[0])
+    y = np.full(batch, start[1])
+    heading = np.full(batch, _HEADINGS.index(start[2]))
+    alive = np.ones(batch, dtype=bool)
+    collision_command = np.full(batch, -1)
+    snaps = [[] for _ in range(batch)]
+
+    def collides(cx, cy, mask):
+        """Checks the footprints centered on (cx, cy), each of shape (batch, n), for the plans in mask"""
+        fx = np.clip(cx[..., None] + footprint[:, 0] + 1, 0, size_x + 1)
+        fy = np.clip(cy[..., None] + footprint[:, 1] + 1, 0, size_y + 1)
+        hit = occupancy[rows[:, None, None], fx, fy].any(axis=(1, 2))
+        return hit & mask
+
+    for k in range(length):
+        op = ops[:, k]
+
+        # Straight moves, one cell at a time
+        straight = alive & ((op == OPCODES["FWD"]) | (op == OPCODES["REV"]))
+        if straight.any():
+            sign = np.where(op == OPCODES["FWD"], 1, -1)
+            step = heading_vectors[heading] * sign[:, None]
+            for s in range(1, values[straight, k].max() // cell_size + 1):
+                moving = straight & (values[:, k] // cell_size >= s)
+                hit = collides((x + step[:, 0])[:, None], (y + step[:, 1])[:, None], moving)
+                collision_command[hit] = k
+                alive &= ~hit
+                moving &= ~hit
+                x = np.where(moving, x + step[:, 0], x)
+                y = np.where(moving, y + step[:, 1], y)
+
+        # Turns, checked along the sampled arc
+        turning = alive & ((op == OPCODES["TURN90L"]) | (op == OPCODES["TURN90R"]))
+        if turning.any():
+            right = (op == OPCODES["TURN90R"]).astype(int)
+            rev = reverse[:, k].astype(int)
+            offsets = turns[heading, right, rev]
+            hit = collides(x[:, None] + offsets[:, :, 0], y[:, None] + offsets[:, :, 1], turning)
+            collision_command[hit] = k
+            alive &= ~hit
+            turning &= ~hit
+            clockwise = right != rev
+            x = np.where(turning, x + offsets[:, -1, 0], x)
+            y = np.where(turning, y + offsets[:, -1, 1], y)
+            heading = np.where(turning, (heading + np.where(clockwise, 1, 3)) % 4, heading)
+
+        for b in np.flatnonzero(alive & (op == OPCODES["SNAP"])):
+            snaps[b].append((plans[b][k].label, int(x[b]), int(y[b]), _HEADINGS[heading[b]]))
+
+    if time_model is not None:
+        costs = time_model.costs
+        # Straight move costs are per CELL_SIZE cm
+        steps = values / CELL_SIZE
+        is_turn = (ops == OPCODES["TURN90L"]) | (ops == OPCODES["TURN90R"])
+        travel_time = (steps * (ops == OPCODES["FWD"])).sum(axis=1) * costs["forward"] + \
+            (steps * (ops == OPCODES["REV"])).sum(axis=1) * costs["reverse"] + \
+            (is_turn & ~reverse).sum(axis=1) * costs["turn_forward"] + \
+            (is_turn & reverse).sum(axis=1) * costs["turn_reverse"] + \
+            (ops == OPCODES["SNAP"]).sum(axis=1) * time_model.snap_dwell
+    else:
+        travel_time = np.full(batch, np.nan)
+
+    return {
+        "x": x,
+        "y": y,
+        "direction": np.array([_HEADINGS[h] for h in heading], dtype=int),
+        "collided": collision_command >= 0,
+        "collision_command": collision_command,
+        "travel_time": travel_time,
+        "snaps": snaps,
+    }
@@ -0,0 +1,179 @@
+import atexit
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+
+from telemetry import Histogram, TIME_BUCKETS
+
+# Images run in one forward pass at most
+DEFAULT_MAX_BATCH = 4
+# Seconds the oldest waiting image may be held back for others to join its batch
+DEFAULT_MAX_LATENCY = 0.005
+
+
+class _Request:
+    __slots__ = ("model", "image", "size", "future", "submitted")
+
+    def __init__(self, model, image, size):
+        self.model = model
+        self.image = image
+        self.size = size
+        self.future = Future()
+        self.submitted = time.perf_counter()
+
+    def key(self):
+        # Only images of the same shape share a batch: AutoShape letterboxes a batch to its largest image, so mixing
+        # shapes would change the padding, and the detections, of the smaller ones
+        shape = getattr(self.image, "shape", None) or getattr(self.image, "size", None)  # numpy or PIL
+        return id(self.model), shape, self.size
+
+
+def split_detections(results):
+    """Splits the Detections of a batch into one Detections per image
+
+    The profiling times of each part are those of the whole batch.
+    """
+    shape = (1, *results.s[1:])
+    return [type(results)([im], [pred], [f], results.times, results.names, shape)
+            for im, pred, f in zip(results.ims, results.pred, results.files)]
+
+
+class InferenceBatcher:
+    """
+    Runs the images of concurrent /image requests through the model together, in one batched AutoShape call.
+
+    A worker thread takes the oldest waiting image, then collects more for up to max_latency seconds or until
+    max_batch images are waiting, runs them as one forward pass and hands each caller the Detections of its own
+    image. Images queued while a batch runs join the next one without waiting, so under load batches fill up even
+    with max_latency = 0. Calls to the model are serialised on the worker; with max_batch = 1 predict() calls the
+    model in the caller's thread instead, as before. close() (also run at exit) finishes the queued images.
+    """
+
+    def __init__(self, max_batch: int = DEFAULT_MAX_BATCH, max_latency: float = DEFAULT_MAX_LATENCY,
+                 name: str = "batcher"):
+        self.max_batch = max(1, max_batch)
+        self.max_latency = max(0.0, max_latency)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.batches = 0
+        self.images = 0
+        self.failed = 0
+        # Images per forward pass, time images wait before their batch runs, and time of each batched call
+        self.fill = Histogram(range(1, self.max_batch + 1))
+        self.wait = Histogram(TIME_BUCKETS)
+        self.inference = Histogram(TIME_BUCKETS)
+        self._thread = None
+        if self.max_batch > 1:
+            self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def predict(self, model, image, size: int = 640):
+        """Runs model(image, size) in the next batch and returns the Detections of image
+
+        Raises whatever the model raised for the batch.
+        """
+        if self._thread is None or self._closed:
+            start = time.perf_counter()
+            try:
+                results = model(image, size=size)
+            except Exception:
+                self._observe(1, [0.0], time.perf_counter() - start, failed=True)
+                raise
+            self._observe(1, [0.0], time.perf_counter() - start)
+            return results
+        request = _Request(model, image, size)
+        self._queue.put(request)
+        return request.future.result()
+
+    def _collect(self, first):
+        """Waits up to max_latency after the first request for a full batch"""
+        batch = [first]
+        deadline = first.submitted + self.max_latency
+        stop = False
+        while len(batch) < self.max_batch:
+            try:
+                request = self._queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            if request is None:
+                stop = True
+                break
+            batch.append(request)
+        return batch, stop
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stop = self._collect(first)
+            groups = defaultdict(list)
+            for request in batch:
+                groups[request.key()].append(request)
+            for requests in groups.values():
+                self._run_batch(requests)
+            if stop:
+                return
+
+    def _run_batch(self, requests):
+        start = time.perf_counter()
+        waits = [start - request.submitted for request in requests]
+        model, size = requests[0].model, requests[0].size
+        try:
+            results = model([request.image for request in requests], size=size)
+            parts = split_detections(results) if len(requests) > 1 else [results]
+        except Exception as e:
+            self._observe(len(requests), waits, time.perf_counter() - start, failed=True)
+            for request in requests:
+                request.future.set_exception(e)
+            return
+        self._observe(len(requests), waits, time.perf_counter() - start)
+        for request, part in zip(requests, parts):
+            request.future.set_result(part)
+
+    def _observe(self, n, waits, seconds, failed=False):
+        with self._lock:
+            self.batches += 1
+            self.images += n
+            if failed:
+                self.failed += n
+            self.fill.observe(n)
+            for wait in waits:
+                self.wait.observe(wait)
+            self.inference.observe(seconds)
+
+    def close(self):
+        """Runs the queued images and stops the worker; later images run in the caller's thread"""
+        if self._closed or self._thread is None:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        # Images queued after the worker stopped
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                self._run_batch([request])
+
+    def stats(self) -> dict:
+        """Batching settings, images waiting, and histograms of batch fill, queue wait and batch inference time"""
+        with self._lock:
+            return {
+                "max_batch": self.max_batch,
+                "max_latency": self.max_latency,
+                "pending": self._queue.qsize(),
+                "batches": self.batches,
+                "images": self.images,
+                "failed": self.failed,
+                "mean_fill": self.images / self.batches if self.batches else None,
+                "fill": self.fill.to_dict(),
+                "wait": self.wait.to_dict(),
+                "inference": self.inference.to_dict(),
+            }
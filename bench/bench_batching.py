@@ -0,0 +1,121 @@
+"""
+Benchmark of concurrent /image inference, each request calling the model alone vs. through InferenceBatcher
+
+Clients send camera-sized images from parallel threads, like several /image requests at once. Without --weights a
+randomly initialised YOLOv5n stands in for Week_9.pt (same architecture family and input shape, so the timings are
+representative), with a near-zero confidence threshold so that NMS still keeps boxes to compare.
+
+Usage:
+    python -m bench.bench_batching
+    python -m bench.bench_batching --clients 1 2 4 8 --batch 4 8 --latency-ms 0 5 --weights Week_9.pt
+"""
+
+import argparse
+import statistics
+import threading
+import time
+
+import numpy as np
+import torch
+
+from batcher import InferenceBatcher
+
+
+def build_model(weights=None, cfg="models/yolov5n.yaml", seed=0):
+    """AutoShape model: the trained weights if given, otherwise a random YOLOv5n"""
+    if weights:
+        return torch.hub.load('./', 'custom', path=weights, source='local')
+    from models.common import AutoShape
+    from models.yolo import DetectionModel
+    torch.manual_seed(seed)
+    model = AutoShape(DetectionModel(cfg, nc=39).fuse().eval(), verbose=False)
+    # Random weights score every box near 0; keep a fixed number of them so the outputs can be compared
+    model.conf = 2e-4
+    model.max_det = 50
+    return model
+
+
+def run_clients(predict, images, n_clients, per_client):
+    """Runs per_client predictions from each of n_clients threads
+
+    Returns:
+        (seconds, latencies): wall time and the latency of every prediction
+    """
+    latencies = []
+    lock = threading.Lock()
+
+    def client(c):
+        for k in range(per_client):
+            start = time.perf_counter()
+            predict(images[(c + k) % len(images)])
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(n_clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, latencies
+
+
+def check_parity(model, images, batcher):
+    """Asserts that batched detections match those of the images run alone"""
+    results = [None] * len(images)
+
+    def client(i):
+        results[i] = batcher.predict(model, images[i])
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(len(images))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for image, result in zip(images, results):
+        alone = model(image).pred[0]
+        assert alone.shape == result.pred[0].shape and torch.allclose(alone, result.pred[0], atol=1e-3), \
+            "batched detections differ from single image inference"
+
+
+def report(name, seconds, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(f"{name:>28}{len(latencies) / seconds:>10.2f}{statistics.median(latencies) * 1000:>12.1f}"
+          f"{p95 * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark batched vs. per-request inference")
+    parser.add_argument("--weights", default=None, help="trained weights, a random YOLOv5n if not given")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--batch", type=int, nargs="+", default=[4, 8])
+    parser.add_argument("--latency-ms", type=float, nargs="+", default=[5])
+    parser.add_argument("--images", type=int, default=4, help="images per client")
+    parser.add_argument("--image-size", default="640x480")
+    parser.add_argument("--seed", type=int, default=0)
+    opt = parser.parse_args()
+
+    model = build_model(opt.weights, seed=opt.seed)
+    width, height = (int(v) for v in opt.image_size.split('x'))
+    rng = np.random.default_rng(opt.seed)
+    images = [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(8)]
+    for image in images[:2]:
+        model(image)  # warm-up
+
+    parity = InferenceBatcher(max_batch=max(opt.batch), max_latency=0.05)
+    check_parity(model, images[:max(opt.batch)], parity)
+    parity.close()
+
+    print(f"{'':>28}{'images/s':>10}{'p50 (ms)':>12}{'p95 (ms)':>12}")
+    for n_clients in opt.clients:
+        print(f"{n_clients} client(s)")
+        report("per request", *run_clients(model, images, n_clients, opt.images))
+        for max_batch in opt.batch:
+            for latency_ms in opt.latency_ms:
+                batcher = InferenceBatcher(max_batch=max_batch, max_latency=latency_ms / 1000)
+                seconds, latencies = run_clients(lambda im: batcher.predict(model, im), images, n_clients,
+                                                 opt.images)
+                batcher.close()
+                report(f"batch {max_batch}, {latency_ms:g} ms", seconds, latencies)
+                print(f"{'mean fill':>28}{batcher.stats()['mean_fill']:>10.2f}")
@@ -0,0 +1,264 @@
+"""
+Benchmark of helper.command_generator on long random paths, against the previous if/elif implementation
+
+Usage:
+    python -m bench.bench_commands
+    python -m bench.bench_commands --steps 100 1000 10000 --repeat 20
+"""
+
+import argparse
+import random
+import time
+
+import helper
+from consts import Direction
+from entities.Entity import CellState
+
+DIRECTIONS = [Direction.NORTH, Direction.EAST, Direction.SOUTH, Direction.WEST]
+STEP = {Direction.NORTH: (0, 1), Direction.EAST: (1, 0), Direction.SOUTH: (0, -1), Direction.WEST: (-1, 0)}
+
+
+def random_path(rng: random.Random, n_steps: int, snap_every: int = 40):
+    """Random walk of straight moves and 90 degree turns with a SNAP every ~snap_every states
+
+    Returns:
+        (states, obstacles) as taken by command_generator
+    """
+    x, y, d = 1, 1, Direction.NORTH
+    states = [CellState(x, y, d)]
+    obstacles = []
+    for _ in range(n_steps):
+        if rng.random() < 0.15:
+            d = DIRECTIONS[(DIRECTIONS.index(d) + rng.choice([1, 3])) % 4]
+            dx, dy = STEP[d]
+            x, y = x + 3 * dx + rng.choice([-1, 1]), y + 3 * dy + rng.choice([-1, 1])
+        else:
+            sign = 1 if rng.random() < 0.7 else -1
+            dx, dy = STEP[d]
+            x, y = x + sign * dx, y + sign * dy
+        state = CellState(x, y, d)
+        if rng.random() < 1 / snap_every:
+            obstacle_id = len(obstacles) + 1
+            state.set_screenshot(obstacle_id)
+            obstacles.append({"x": x + rng.randint(-1, 1), "y": y + rng.randint(-1, 1), "id": obstacle_id,
+                              "d": int(rng.choice(DIRECTIONS))})
+        states.append(state)
+    return states, obstacles
+
+
+def legacy_command_generator(states: list, obstacles: list, speed: int = None) -> list:
+    """command_generator before it became table-driven, kept as the reference for output and speed.
+    
+    Args:
+        states: List of State objects representing robot path
+        obstacles: List of obstacles, each a dict with keys 'x', 'y', 'd', 'id'
+        speed: Motor speed (0-100). If None, uses DEFAULT_SPEED
+
+    Returns:
+        List of motor protocol command strings in format :[cmdId]/[component]/[command]/[param1]/[param2];
+    """
+
+    # Convert the list of obstacles into a dictionary with key as the obstacle id and value as the obstacle
+    obstacles_dict = {ob['id']: ob for ob in obstacles}
+    
+    # Use provided speed or default
+    motor_speed = speed if speed is not None else helper.DEFAULT_SPEED
+    
+    # Initialize commands list and command ID counter
+    commands = []
+    cmd_id = 1
+
+    # Iterate through each state in the list of states
+    for i in range(1, len(states)):
+        steps = "00"
+
+        # If previous state and current state are the same direction,
+        if states[i].direction == states[i - 1].direction:
+            # Forward - Must be (east facing AND x value increased) OR (north facing AND y value increased)
+            if (states[i].x > states[i - 1].x and states[i].direction == Direction.EAST) or (states[i].y > states[i - 1].y and states[i].direction == Direction.NORTH):
+                commands.append(f":{cmd_id}/MOTOR/FWD/{motor_speed}/10;")
+                cmd_id += 1
+            # Forward - Must be (west facing AND x value decreased) OR (south facing AND y value decreased)
+            elif (states[i].x < states[i-1].x and states[i].direction == Direction.WEST) or (
+                    states[i].y < states[i-1].y and states[i].direction == Direction.SOUTH):
+                commands.append(f":{cmd_id}/MOTOR/FWD/{motor_speed}/10;")
+                cmd_id += 1
+            # Backward - All other cases where the previous and current state is the same direction
+            else:
+                commands.append(f":{cmd_id}/MOTOR/REV/{motor_speed}/10;")
+                cmd_id += 1
+
+            # If any of these states has a valid screenshot ID, add a SNAP command
+            if states[i].screenshot_id != -1:
+                snap_cmd = helper._get_snap_command(
+                    states[i].screenshot_id,
+                    obstacles_dict[states[i].screenshot_id],
+                    states[i]
+                )
+                commands.append(snap_cmd)
+            continue
+
+        # If previous state and current state are not the same direction, it means that there will be a turn command involved
+        # Assume there are 4 turning command: FR, FL, BL, BR (the turn command will turn the robot 90 degrees)
+        # FR00 | FR30: Forward Right;
+        # FL00 | FL30: Forward Left;
+        # BR00 | BR30: Backward Right;
+        # BL00 | BL30: Backward Left;
+
+        # Facing north previously
+        if states[i - 1].direction == Direction.NORTH:
+            # Facing east afterwards
+            if states[i].direction == Direction.EAST:
+                # y value increased -> Forward Right
+                if states[i].y > states[i - 1].y:
+                    commands.append(f":{cmd_id}/MOTOR/TURN90R/{motor_speed}/0;")
+                    cmd_id += 1
+                # y value decreased -> Backward Left
+                else:
+                    commands.append(f":{cmd_id}/MOTOR/TURN90L/{motor_speed}/0;")
+                    cmd_id += 1
+            # Facing west afterwards
+            elif states[i].direction == Direction.WEST:
+                # y value increased -> Forward Left
+                if states[i].y > states[i - 1].y:
+                    commands.append(f":{cmd_id}/MOTOR/TURN90L/{motor_speed}/0;")
+                    cmd_id += 1
+                # y value decreased -> Backward Right
+                else:
+                    commands.append(f":{cmd_id}/MOTOR/TURN90R/{motor_speed}/0;")
+                    cmd_id += 1
+            else:
+                raise Exception("Invalid turing direction")
+
+        elif states[i - 1].direction == Direction.EAST:
+            if states[i].direction == Direction.NORTH:
+                if states[i].y > states[i - 1].y:
+                    commands.append(f":{cmd_id}/MOTOR/TURN90L/{motor_speed}/0;")
+                    cmd_id += 1
+                else:
+                    commands.append(f":{cmd_id}/MOTOR/TURN90R/{motor_speed}/0;")
+                    cmd_id += 1
+
+            elif states[i].direction == Direction.SOUTH:
+                if states[i].y > states[i - 1].y:
+                    commands.append(f":{cmd_id}/MOTOR/TURN90L/{motor_speed}/0;")
+                    cmd_id += 1
+                else:
+                    commands.append(f":{cmd_id}/MOTOR/TURN90R/{motor_speed}/0;")
+                    cmd_id += 1
+            else:
+                raise Exception("Invalid turing direction")
+
+        elif states[i - 1].direction == Direction.SOUTH:
+            if states[i].direction == Direction.EAST:
+                if states[i].y > states[i - 1].y:
+                    commands.append(f":{cmd_id}/MOTOR/TURN90R/{motor_speed}/0;")
+                    cmd_id += 1
+                else:
+                    commands.append(f":{cmd_id}/MOTOR/TURN90L/{motor_speed}/0;")
+                    cmd_id += 1
+            elif states[i].direction == Direction.WEST:
+                if states[i].y > states[i - 1].y:
+                    commands.append(f":{cmd_id}/MOTOR/TURN90L/{motor_speed}/0;")
+                    cmd_id += 1
+                else:
+                    commands.append(f":{cmd_id}/MOTOR/TURN90R/{motor_speed}/0;")
+                    cmd_id += 1
+            else:
+                raise Exception("Invalid turing direction")
+
+        elif states[i - 1].direction == Direction.WEST:
+            if states[i].direction == Direction.NORTH:
+                if states[i].y > states[i - 1].y:
+                    commands.append(f":{cmd_id}/MOTOR/TURN90R/{motor_speed}/0;")
+                    cmd_id += 1
+                else:
+                    commands.append(f":{cmd_id}/MOTOR/TURN90L/{motor_speed}/0;")
+                    cmd_id += 1
+            elif states[i].direction == Direction.SOUTH:
+                if states[i].y > states[i - 1].y:
+                    commands.append(f":{cmd_id}/MOTOR/TURN90R/{motor_speed}/0;")
+                    cmd_id += 1
+                else:
+                    commands.append(f":{cmd_id}/MOTOR/TURN90L/{motor_speed}/0;")
+                    cmd_id += 1
+            else:
+                raise Exception("Invalid turing direction")
+        else:
+            raise Exception("Invalid position")
+
+        # If any of these states has a valid screenshot ID, add a SNAP command
+        if states[i].screenshot_id != -1:
+            snap_cmd = helper._get_snap_command(
+                states[i].screenshot_id,
+                obstacles_dict[states[i].screenshot_id],
+                states[i]
+            )
+            commands.append(snap_cmd)
+
+    # Final command is the stop command
+    commands.append(f":{cmd_id}/MOTOR/STOP/0/0;")
+    cmd_id += 1
+    commands.append("FIN")  # Keep FIN marker for higher-level processing
+
+    # Compress commands if there are consecutive forward or backward commands
+    compressed_commands = [commands[0]]
+
+    for i in range(1, len(commands)):
+        # If both commands are REV (backward)
+        if "/MOTOR/REV/" in commands[i] and "/MOTOR/REV/" in compressed_commands[-1]:
+            # Extract distance from previous command
+            parts = compressed_commands[-1].split("/")
+            distance = int(parts[-1].rstrip(";"))
+            # If distance is not 90, add 10 to the distance
+            if distance != 90:
+                cmd_parts = compressed_commands[-1].split("/")
+                cmd_parts[-1] = f"{distance + 10};"
+                compressed_commands[-1] = "/".join(cmd_parts)
+                continue
+
+        # If both commands are FWD (forward)
+        elif "/MOTOR/FWD/" in commands[i] and "/MOTOR/FWD/" in compressed_commands[-1]:
+            # Extract distance from previous command
+            parts = compressed_commands[-1].split("/")
+            distance = int(parts[-1].rstrip(";"))
+            # If distance is not 90, add 10 to the distance
+            if distance != 90:
+                cmd_parts = compressed_commands[-1].split("/")
+                cmd_parts[-1] = f"{distance + 10};"
+                compressed_commands[-1] = "/".join(cmd_parts)
+                continue
+        
+        # Otherwise, just add as usual
+        compressed_commands.append(commands[i])
+
+    return compressed_commands
+
+
+def best_time(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark command_generator on long random paths")
+    parser.add_argument("--steps", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    opt = parser.parse_args()
+
+    rng = random.Random(opt.seed)
+    print(f"{'steps':>8}{'commands':>10}{'legacy (ms)':>14}{'current (ms)':>14}{'speed-up':>10}")
+    for n_steps in opt.steps:
+        states, obstacles = random_path(rng, n_steps)
+        expected = legacy_command_generator(states, obstacles)
+        actual = helper.command_generator(states, obstacles)
+        assert actual == expected, f"command_generator output differs from the legacy generator ({n_steps} steps)"
+
+        legacy = best_time(lambda: legacy_command_generator(states, obstacles), opt.repeat)
+        current = best_time(lambda: helper.command_generator(states, obstacles), opt.repeat)
+        print(f"{n_steps:>8}{len(actual):>10}{legacy * 1000:>14.2f}{current * 1000:>14.2f}{legacy / current:>9.1f}x")
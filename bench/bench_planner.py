@@ -0,0 +1,171 @@
+"""
+Randomised layout benchmark for MazeSolver
+
+Usage:
+    python -m bench.bench_planner run --out runs/bench/base.json
+    python -m bench.bench_planner run --obstacles 1 4 8 --density sparse dense --big-turn 0 1 --layouts 10
+    python -m bench.bench_planner compare runs/bench/base.json runs/bench/new.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import time
+import tracemalloc
+
+import numpy as np
+
+from algo.algo import MazeSolver
+from bench.layouts import DENSITY_SPACING, generate_layout
+from consts import WIDTH, HEIGHT
+from helper import command_generator
+
+PERCENTILES = (50, 95, 99)
+
+
+def summarize(values: list) -> dict:
+    """p50/p95/p99, mean and max of a list of samples"""
+    if not values:
+        return {}
+    summary = {f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES}
+    summary["mean"] = float(np.mean(values))
+    summary["max"] = float(np.max(values))
+    return summary
+
+
+def solve(layout: dict, big_turn: int):
+    """Solves a layout from scratch and returns the MazeSolver, the distance and the commands"""
+    maze_solver = MazeSolver(WIDTH, HEIGHT, layout['robot_x'], layout['robot_y'], layout['robot_dir'],
+                             big_turn=big_turn)
+    for ob in layout['obstacles']:
+        maze_solver.add_obstacle(ob['x'], ob['y'], ob['d'], ob['id'])
+    optimal_path, distance = maze_solver.get_optimal_order_dp(retrying=layout['retrying'])
+    commands = command_generator(optimal_path, layout['obstacles']) if optimal_path else []
+    return maze_solver, distance, commands
+
+
+def run_case(layouts: list, big_turn: int, memory: bool) -> dict:
+    """Benchmarks one configuration over its layouts"""
+    latencies, nodes, distances, commands, peaks = [], [], [], [], []
+
+    for layout in layouts:
+        start = time.perf_counter()
+        maze_solver, distance, cmds = solve(layout, big_turn)
+        latencies.append(time.perf_counter() - start)
+        nodes.append(maze_solver.stats["nodes_expanded"])
+        distances.append(distance)
+        commands.append(len(cmds))
+
+        # tracemalloc slows the solver down, so peak memory comes from a separate run
+        if memory:
+            tracemalloc.start()
+            solve(layout, big_turn)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    return {
+        "samples": len(layouts),
+        "latency": summarize(latencies),
+        "nodes_expanded": summarize(nodes),
+        "peak_memory": summarize(peaks),
+        "distance": summarize(distances),
+        "commands": summarize(commands),
+    }
+
+
+def run(opt):
+    cases = []
+    for n_obstacles, density, big_turn, retrying in itertools.product(opt.obstacles, opt.density, opt.big_turn,
+                                                                      opt.retrying):
+        # Every configuration gets its own seeded generator so adding configurations does not change layouts
+        rng = random.Random(f"{opt.seed}-{n_obstacles}-{density}-{retrying}")
+        layouts = [generate_layout(rng, n_obstacles, density, retrying) for _ in range(opt.layouts)]
+
+        name = f"n={n_obstacles},density={density},big_turn={big_turn},retrying={retrying}"
+        result = run_case(layouts, big_turn, opt.memory)
+        result.update(name=name, obstacles=n_obstacles, density=density, big_turn=big_turn, retrying=retrying)
+        cases.append(result)
+
+        latency = result["latency"]
+        print(f"{name:<50} p50 {latency['p50'] * 1000:9.1f}ms  p95 {latency['p95'] * 1000:9.1f}ms  "
+              f"p99 {latency['p99'] * 1000:9.1f}ms  nodes {result['nodes_expanded']['p50']:9.0f}")
+
+    report = {
+        "meta": {
+            "seed": opt.seed,
+            "layouts": opt.layouts,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "cases": cases,
+    }
+
+    if opt.out:
+        os.makedirs(os.path.dirname(opt.out) or ".", exist_ok=True)
+        with open(opt.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {opt.out}")
+    return report
+
+
+def compare(opt):
+    with open(opt.base) as f:
+        base = {case["name"]: case for case in json.load(f)["cases"]}
+    with open(opt.new) as f:
+        new = {case["name"]: case for case in json.load(f)["cases"]}
+
+    metrics = [("latency", "p50"), ("latency", "p95"), ("latency", "p99"), ("nodes_expanded", "p50"),
+               ("peak_memory", "p50"), ("distance", "mean")]
+
+    print(f"{'case':<50}" + "".join(f"{m + '.' + p:>22}" for m, p in metrics))
+    for name in base:
+        if name not in new:
+            print(f"{name:<50} missing from {opt.new}")
+            continue
+        row = f"{name:<50}"
+        for metric, p in metrics:
+            old_value = base[name][metric].get(p)
+            new_value = new[name][metric].get(p)
+            if old_value is None or new_value is None:
+                row += f"{'-':>22}"
+            elif old_value == 0:
+                row += f"{'+0.0%' if new_value == 0 else 'new':>22}"
+            else:
+                row += f"{(new_value - old_value) / old_value * 100:>+21.1f}%"
+        print(row)
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser(description="Benchmark MazeSolver on randomised layouts")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmark")
+    run_parser.add_argument("--obstacles", type=int, nargs="+", default=[1, 2, 3, 4, 5, 6],
+                            help="obstacle counts (1-12, counts above 8 take minutes per layout)")
+    run_parser.add_argument("--density", nargs="+", default=["normal"], choices=sorted(DENSITY_SPACING))
+    run_parser.add_argument("--big-turn", type=int, nargs="+", default=[0], choices=[0, 1])
+    run_parser.add_argument("--retrying", type=lambda s: s.lower() in ("1", "true", "yes"), nargs="+",
+                            default=[False], help="retrying values, e.g. --retrying false true")
+    run_parser.add_argument("--layouts", type=int, default=5, help="layouts per configuration")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--no-memory", dest="memory", action="store_false",
+                            help="skip the tracemalloc peak memory run")
+    run_parser.add_argument("--out", type=str, default="", help="JSON file to write the results to")
+
+    compare_parser = subparsers.add_parser("compare", help="diff two benchmark results")
+    compare_parser.add_argument("base", type=str)
+    compare_parser.add_argument("new", type=str)
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opt = parse_opt()
+    if opt.mode == "run":
+        run(opt)
+    else:
+        compare(opt)
@@ -0,0 +1,147 @@
+"""
+Benchmark of the detection post-processing of model.py on random detections, against the previous pandas
+implementation
+
+Usage:
+    python -m bench.bench_postprocess
+    python -m bench.bench_postprocess --detections 0 1 5 20 --cases 500
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+import torch
+
+import model
+from consts import NAME_TO_ID
+from models.common import Detections
+from utils.general import Profile
+
+# Class names of the model, in the order of its class indices
+NAMES = [name for name in NAME_TO_ID if name != 'NA']
+SIGNALS = ['L', 'C', 'R']
+
+
+def legacy_select_prediction(results, signal):
+    """Previous predict_image selection, on the pandas dataframe of the results; returns a pandas.Series or 'NA'"""
+    df_results = results.pandas().xyxy[0]
+    df_results['bboxHt'] = df_results['ymax'] - df_results['ymin']
+    df_results['bboxWt'] = df_results['xmax'] - df_results['xmin']
+    df_results['bboxArea'] = df_results['bboxHt'] * df_results['bboxWt']
+    df_results = df_results.sort_values('bboxArea', ascending=False)
+    pred_list = df_results[df_results['name'] != 'Bullseye']
+    pred = 'NA'
+    if len(pred_list) == 1:
+        pred = pred_list.iloc[0]
+    elif len(pred_list) > 1:
+        pred_shortlist = []
+        current_area = pred_list.iloc[0]['bboxArea']
+        for _, row in pred_list.iterrows():
+            if row['name'] != 'Bullseye' and row['confidence'] > 0.5 and ((current_area * 0.8 <= row['bboxArea']) or (row['name'] == 'One' and current_area * 0.6 <= row['bboxArea'])):
+                pred_shortlist.append(row)
+                current_area = row['bboxArea']
+        if len(pred_shortlist) == 1:
+            pred = pred_shortlist[0]
+        else:
+            pred_shortlist.sort(key=lambda x: x['xmin'])
+            # An empty shortlist raised IndexError here, which predict_image turned into 'NA'
+            if not pred_shortlist:
+                return 'NA'
+            if signal == 'L':
+                pred = pred_shortlist[0]
+            elif signal == 'R':
+                pred = pred_shortlist[-1]
+            else:
+                for i in range(len(pred_shortlist)):
+                    if pred_shortlist[i]['xmin'] > 250 and pred_shortlist[i]['xmin'] < 774:
+                        pred = pred_shortlist[i]
+                        break
+                if isinstance(pred, str):
+                    pred_shortlist.sort(key=lambda x: x['bboxArea'])
+                    pred = pred_shortlist[-1]
+    return pred
+
+
+def legacy_select_prediction_week_9(results):
+    """Previous predict_image_week_9 selection; returns a pandas.Series or 'NA'"""
+    df_results = results.pandas().xyxy[0]
+    df_results['bboxHt'] = df_results['ymax'] - df_results['ymin']
+    df_results['bboxWt'] = df_results['xmax'] - df_results['xmin']
+    df_results['bboxArea'] = df_results['bboxHt'] * df_results['bboxWt']
+    df_results = df_results.sort_values('bboxArea', ascending=False)
+    pred = 'NA'
+    if df_results.size != 0:
+        for _, row in df_results.iterrows():
+            if row['name'] != 'Bullseye' and row['confidence'] > 0.5:
+                pred = row
+                break
+    return pred
+
+
+def image_id(pred):
+    return str(NAME_TO_ID[pred['name']]) if not isinstance(pred, str) and pred is not None else 'NA'
+
+
+def random_detections(rng: random.Random, n: int, width: int = 1024, height: int = 768) -> Detections:
+    """Detections of one image with n random boxes, some of them Bullseye or 'One', with confidences straddling 0.5
+
+    Corners are fractional like the model's, so no two boxes have exactly the same area: pandas sorted equal areas
+    in an unspecified order, so ties have no reference answer.
+    """
+    rows = []
+    for _ in range(n):
+        w, h = rng.uniform(20, 400), rng.uniform(20, 400)
+        x, y = rng.uniform(0, width - w), rng.uniform(0, height - h)
+        name = rng.choice(['Bullseye', 'One'] + NAMES)
+        rows.append([x, y, x + w, y + h, rng.uniform(0.25, 1.0), NAMES.index(name)])
+    pred = torch.tensor(rows, dtype=torch.float32).reshape(-1, 6)
+    im = np.zeros((height, width, 3), dtype=np.uint8)
+    return Detections([im], [pred], ['image0.jpg'], times=(Profile(), Profile(), Profile()), names=NAMES,
+                      shape=(1, 3, height, width))
+
+
+def best_time(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the detection post-processing on random detections")
+    parser.add_argument("--detections", type=int, nargs="+", default=[0, 1, 2, 5, 10, 30])
+    parser.add_argument("--cases", type=int, default=200, help="random images checked per detection count")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    opt = parser.parse_args()
+
+    rng = random.Random(opt.seed)
+    print(f"{'detections':>10}{'legacy (ms)':>14}{'current (ms)':>14}{'speed-up':>10}")
+    for n in opt.detections:
+        cases = [(random_detections(rng, n), rng.choice(SIGNALS)) for _ in range(opt.cases)]
+        for results, signal in cases:
+            expected = image_id(legacy_select_prediction(results, signal))
+            actual = image_id(model.select_prediction(results, signal))
+            assert actual == expected, f"select_prediction differs from pandas ({n} detections, signal {signal})"
+            expected = image_id(legacy_select_prediction_week_9(results))
+            actual = image_id(model.select_prediction_week_9(results))
+            assert actual == expected, f"select_prediction_week_9 differs from pandas ({n} detections)"
+
+        def run_legacy():
+            for results, signal in cases:
+                legacy_select_prediction(results, signal)
+                legacy_select_prediction_week_9(results)
+
+        def run_current():
+            for results, signal in cases:
+                model.select_prediction(results, signal)
+                model.select_prediction_week_9(results)
+
+        # Time per image, both selections
+        legacy = best_time(run_legacy, opt.repeat) / len(cases)
+        current = best_time(run_current, opt.repeat) / len(cases)
+        print(f"{n:>10}{legacy * 1000:>14.3f}{current * 1000:>14.3f}{legacy / current:>9.1f}x")
@@ -0,0 +1,109 @@
+"""
+Latency and accuracy of the inference precisions of DetectMultiBackend (see utils.torch_utils.select_precision)
+
+Every precision loads the same checkpoint through torch.hub, like load_model, and runs the same images. Accuracy
+is measured against the fp32 detections: the share of fp32 boxes found again (same class, IoU >= 0.5), their mean
+IoU and the largest confidence difference. Without --weights a randomly initialised YOLOv5s checkpoint stands in for
+Week_9.pt, with a near-zero confidence threshold so that NMS keeps boxes to compare.
+
+Usage:
+    python -m bench.bench_precision
+    python -m bench.bench_precision --weights Week_9.pt --images uploads --precisions fp32 bf16 fp16
+"""
+
+import argparse
+import glob
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+# Checkpoints are pickled models, which torch>=2.6 refuses to load by default
+os.environ.setdefault('TORCH_FORCE_NO_WEIGHTS_ONLY_LOAD', '1')
+
+from utils.metrics import box_iou  # noqa: E402
+
+
+def random_checkpoint(cfg="models/yolov5s.yaml", nc=39, seed=0):
+    """Saves a randomly initialised model as a checkpoint, returns its path"""
+    from models.yolo import DetectionModel
+    torch.manual_seed(seed)
+    model = DetectionModel(cfg, nc=nc)
+    model.names = {i: f'class{i}' for i in range(nc)}
+    path = os.path.join(tempfile.mkdtemp(), 'random.pt')
+    torch.save({'model': model}, path)
+    return path
+
+
+def load_images(folder, n, image_size, seed=0):
+    """Up to n images of folder, or n random camera-sized images if no folder is given"""
+    if folder:
+        paths = sorted(glob.glob(os.path.join(folder, '*.jpg')) + glob.glob(os.path.join(folder, '*.png')))[:n]
+        return [np.asarray(Image.open(p).convert('RGB')) for p in paths]
+    width, height = image_size
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(n)]
+
+
+def compare(reference, pred, iou=0.5):
+    """Matches the fp32 detections to those of another precision
+
+    Returns:
+        (matched, ious, conf_diffs): number of reference boxes matched, IoUs and confidence differences of the matches
+    """
+    if len(reference) == 0 or len(pred) == 0:
+        return 0, [], []
+    ious = box_iou(reference[:, :4], pred[:, :4])
+    ious[reference[:, 5:6] != pred[:, 5:6].T] = 0
+    best, j = ious.max(1)
+    keep = best >= iou
+    return int(keep.sum()), best[keep].tolist(), (reference[keep, 4] - pred[j[keep], 4]).abs().tolist()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare inference precisions on latency and accuracy")
+    parser.add_argument("--weights", default=None, help="checkpoint, a random YOLOv5s if not given")
+    parser.add_argument("--images", default=None, help="folder of .jpg/.png images, random images if not given")
+    parser.add_argument("--n-images", type=int, default=8)
+    parser.add_argument("--image-size", default="640x480")
+    parser.add_argument("--precisions", nargs="+", default=['fp32', 'bf16', 'fp16'])
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--repeat", type=int, default=3)
+    opt = parser.parse_args()
+
+    weights = opt.weights or random_checkpoint()
+    images = load_images(opt.images, opt.n_images, tuple(int(v) for v in opt.image_size.split('x')))
+    reference = None
+
+    print(f"{'precision':>14}{'running':>14}{'p50 (ms)':>10}{'matched':>10}{'mean IoU':>10}{'max dconf':>11}")
+    for precision in ['fp32'] + [p for p in opt.precisions if p != 'fp32']:
+        model = torch.hub.load('./', 'custom', path=weights, source='local', device=opt.device, precision=precision,
+                               verbose=False)
+        if opt.weights is None:
+            model.conf, model.max_det = 2e-4, 50
+        model(images[0])  # warm-up
+
+        latencies, preds = [], []
+        for image in images:
+            times = []
+            for _ in range(opt.repeat):
+                start = time.perf_counter()
+                results = model(image)
+                times.append(time.perf_counter() - start)
+            latencies.append(min(times))
+            preds.append(results.pred[0].float().cpu())
+        if reference is None:
+            reference = preds
+
+        matched, ious, conf_diffs = 0, [], []
+        for ref, pred in zip(reference, preds):
+            m, i, c = compare(ref, pred)
+            matched, ious, conf_diffs = matched + m, ious + i, conf_diffs + c
+        total = sum(len(ref) for ref in reference)
+        print(f"{precision:>14}{model.model.precision:>14}{statistics.median(latencies) * 1000:>10.1f}"
+              f"{f'{matched}/{total}':>10}{statistics.mean(ious) if ious else float('nan'):>10.4f}"
+              f"{max(conf_diffs, default=float('nan')):>11.2e}")
@@ -0,0 +1,85 @@
+"""
+Benchmark of the AutoShape pre-processing into pooled input buffers (models.common.InputBuffers), against the
+previous implementation that allocated every intermediate array
+
+Both run on the same camera-sized images and must produce the same model input, bit for bit. Reports the
+pre-processing time per call and the numpy memory it allocates (tracemalloc peak). A randomly initialised YOLOv5n
+stands in for Week_9.pt (see bench_batching); pre-processing does not depend on the weights.
+
+Usage:
+    python -m bench.bench_preprocess
+    python -m bench.bench_preprocess --batch 1 4 --image-size 640x480 --channels-last
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import torch
+
+from bench.bench_batching import build_model
+from utils.augmentations import letterbox
+from utils.general import make_divisible
+
+
+def legacy_preprocess(model, ims, size=640):
+    """Previous AutoShape pre-processing of HWC uint8 arrays, returns the BCHW model input"""
+    p = next(model.model.parameters())
+    shape1 = [[int(y * size / max(im.shape[:2])) for y in im.shape[:2]] for im in ims]
+    shape1 = [make_divisible(x, model.stride) for x in np.array(shape1).max(0)]  # inf shape
+    x = [letterbox(im, shape1, auto=False)[0] for im in ims]  # pad
+    x = np.ascontiguousarray(np.array(x).transpose((0, 3, 1, 2)))  # stack and BHWC to BCHW
+    return torch.from_numpy(x).to(p.device).type_as(p) / 255  # uint8 to fp16/32
+
+
+def pooled_preprocess(model, ims):
+    """Runs AutoShape, returns its pre-processing time and the model input it built"""
+    inputs = []
+    hook = model.model.register_forward_pre_hook(lambda m, args: inputs.append(args[0].clone()))
+    try:
+        results = model(ims)
+    finally:
+        hook.remove()
+    return results.times[0].dt, inputs[0]
+
+
+def measure(fn, repeat):
+    """Best time and numpy memory peak (bytes) of fn over repeat calls"""
+    times, peaks = [], []
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return min(times), min(peaks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pooled vs. allocating AutoShape pre-processing")
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--image-size", default="640x480")
+    parser.add_argument("--channels-last", action="store_true", help="model input in channels_last memory")
+    parser.add_argument("--repeat", type=int, default=20)
+    opt = parser.parse_args()
+
+    model = build_model()
+    model.model.channels_last = opt.channels_last  # read by AutoShape like DetectMultiBackend.channels_last
+    width, height = (int(v) for v in opt.image_size.split('x'))
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(max(opt.batch))]
+
+    print(f"{'batch':>6}{'legacy (ms)':>13}{'pooled (ms)':>13}{'speed-up':>10}{'legacy (MB)':>13}{'pooled (MB)':>13}")
+    for batch in opt.batch:
+        ims = images[:batch]
+        pooled_preprocess(model, ims)  # allocates this shape's buffers
+        _, x = pooled_preprocess(model, ims)
+        assert torch.equal(x, legacy_preprocess(model, ims)), f"pooled input differs from legacy (batch {batch})"
+
+        legacy_t, legacy_mem = measure(lambda: legacy_preprocess(model, ims), opt.repeat)
+        _, pooled_mem = measure(lambda: pooled_preprocess(model, ims), opt.repeat)
+        pooled_t = min(pooled_preprocess(model, ims)[0] for _ in range(opt.repeat))
+        print(f"{batch:>6}{legacy_t * 1000:>13.2f}{pooled_t * 1000:>13.2f}{legacy_t / pooled_t:>9.2f}x"
+              f"{legacy_mem / 1e6:>13.2f}{pooled_mem / 1e6:>13.2f}")
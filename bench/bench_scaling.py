@@ -0,0 +1,111 @@
+"""
+How MazeSolver solve time scales with the resolution of the planning grid
+
+The same seeded layouts are solved on the default 10 cm grid and on finer grids (bench.layouts.scale_layout), and
+every plan is replayed in algo.simulator to check that it is collision free at that resolution.
+
+Usage:
+    python -m bench.bench_scaling
+    python -m bench.bench_scaling --cell-size 10 5 2 --obstacles 1 3 --layouts 3 --out runs/bench/scaling.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import time
+
+from algo.simulator import simulate
+from bench.bench_planner import summarize
+from bench.layouts import generate_layout, scale_layout
+from consts import CELL_SIZE
+from helper import iter_command_records
+from planner import arena_config, build_maze_solver
+
+
+def run_case(layouts: list, cell_size: int) -> dict:
+    """Solves the layouts at one resolution"""
+    latencies, nodes, distances, collisions, unsolved = [], [], [], 0, 0
+
+    for layout in layouts:
+        layout = scale_layout(layout, cell_size)
+        start = time.perf_counter()
+        maze_solver, obstacles, retrying = build_maze_solver(layout)
+        optimal_path, distance = maze_solver.get_optimal_order_dp(retrying=retrying)
+        latencies.append(time.perf_counter() - start)
+        nodes.append(maze_solver.stats["nodes_expanded"])
+        if not optimal_path:
+            unsolved += 1
+            continue
+        distances.append(distance)
+
+        records = [c for leg in iter_command_records(optimal_path, obstacles, cell_size=cell_size) for c in leg]
+        size_x, size_y, _ = arena_config(layout)
+        start_pose = (layout['robot_x'], layout['robot_y'], optimal_path[0].direction)
+        result = simulate([records], obstacles, start=start_pose, size_x=size_x, size_y=size_y, cell_size=cell_size)
+        collisions += int(result["collided"][0])
+
+    size_x, size_y, _ = arena_config({"cell_size": cell_size})
+    return {
+        "cell_size": cell_size,
+        "grid": [size_x, size_y],
+        "samples": len(layouts),
+        "unsolved": unsolved,
+        "collisions": collisions,
+        "latency": summarize(latencies),
+        "nodes_expanded": summarize(nodes),
+        "distance": summarize(distances),
+    }
+
+
+def run(opt):
+    cases = []
+    for n_obstacles in opt.obstacles:
+        rng = random.Random(f"{opt.seed}-{n_obstacles}")
+        layouts = [generate_layout(rng, n_obstacles) for _ in range(opt.layouts)]
+        base = None
+        for cell_size in opt.cell_size:
+            result = run_case(layouts, cell_size)
+            result["obstacles"] = n_obstacles
+            cases.append(result)
+
+            latency = result["latency"]
+            base = base or latency["p50"]
+            print(f"n={n_obstacles:<3} cell={cell_size:>2}cm grid={result['grid'][0]}x{result['grid'][1]:<4} "
+                  f"p50 {latency['p50'] * 1000:9.1f}ms ({latency['p50'] / base:5.1f}x)  "
+                  f"p95 {latency['p95'] * 1000:9.1f}ms  nodes {result['nodes_expanded']['p50']:9.0f}  "
+                  f"unsolved {result['unsolved']}  collisions {result['collisions']}")
+
+    report = {
+        "meta": {
+            "seed": opt.seed,
+            "layouts": opt.layouts,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "cases": cases,
+    }
+
+    if opt.out:
+        os.makedirs(os.path.dirname(opt.out) or ".", exist_ok=True)
+        with open(opt.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {opt.out}")
+    return report
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser(description="Benchmark MazeSolver across planning grid resolutions")
+    parser.add_argument("--cell-size", type=int, nargs="+", default=[CELL_SIZE, CELL_SIZE // 2],
+                        help=f"cell sizes in cm, each dividing {CELL_SIZE}")
+    parser.add_argument("--obstacles", type=int, nargs="+", default=[1, 2, 3, 4])
+    parser.add_argument("--layouts", type=int, default=3, help="layouts per obstacle count")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=str, default="", help="JSON file to write the results to")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    run(parse_opt())
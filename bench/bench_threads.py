@@ -0,0 +1,116 @@
+"""
+Sweep of torch threading and memory format settings, to pick MDP_TORCH_THREADS, MDP_TORCH_INTEROP_THREADS and
+MDP_CHANNELS_LAST for a machine
+
+Every combination of intra-op threads, inter-op threads and channels_last runs in its own process, as inter-op
+threads can only be set once per process. Each loads the model with load_model, like the server, and reports the
+p50 latency of single images and the throughput of concurrent clients. channels_last runs are checked against the
+NCHW detections. Without --weights a randomly initialised YOLOv5s checkpoint stands in for Week_9.pt (see
+bench_precision).
+
+Usage:
+    python -m bench.bench_threads
+    python -m bench.bench_threads --weights Week_9.pt --threads 1 2 4 --interop 1 2 --clients 4
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+import torch
+
+from bench.bench_precision import compare, random_checkpoint
+
+
+def worker(opt):
+    """Measures one setting in this process, prints the result as a JSON line"""
+    from bench.bench_batching import run_clients
+    from model import load_model
+
+    def load(channels_last):
+        model = load_model(weights=opt.weights, channels_last=channels_last, threads=opt.threads,
+                           interop_threads=opt.interop)
+        if opt.random_weights:
+            model.conf, model.max_det = 2e-4, 50
+        return model
+
+    width, height = (int(v) for v in opt.image_size.split('x'))
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(4)]
+    model = load(opt.channels_last)
+    for _ in range(3):
+        model(images[0])  # warm-up
+
+    latencies = []
+    for image in images * opt.repeat:
+        start = time.perf_counter()
+        model(image)
+        latencies.append(time.perf_counter() - start)
+    seconds, _ = run_clients(model, images, opt.clients, opt.repeat)
+
+    matched, total = None, None
+    if opt.channels_last:
+        reference = load(False)
+        matched, total = 0, 0
+        for image in images:
+            ref = reference(image).pred[0]
+            matched, total = matched + compare(ref, model(image).pred[0])[0], total + len(ref)
+    print(json.dumps({'threads': torch.get_num_threads(), 'interop': torch.get_num_interop_threads(),
+                      'p50': statistics.median(latencies), 'throughput': opt.clients * opt.repeat / seconds,
+                      'matched': matched, 'total': total}))
+
+
+def measure(weights, random_weights, threads, interop, channels_last, opt):
+    """Runs worker() in a fresh process, returns its result"""
+    cmd = [sys.executable, '-W', 'ignore', '-m', 'bench.bench_threads', '--worker', '--weights', weights,
+           '--threads', str(threads), '--interop', str(interop), '--clients', str(opt.clients),
+           '--repeat', str(opt.repeat), '--image-size', opt.image_size]
+    cmd += ['--channels-last'] * channels_last + ['--random-weights'] * random_weights
+    out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep torch threads and channels_last for this machine")
+    parser.add_argument("--weights", default=None, help="checkpoint, a random YOLOv5s if not given")
+    parser.add_argument("--threads", type=int, nargs="+", default=None, help="intra-op threads, 1..cores by default")
+    parser.add_argument("--interop", type=int, nargs="+", default=None, help="inter-op threads, 1 and 2 by default")
+    parser.add_argument("--clients", type=int, default=4, help="concurrent clients for the throughput")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the 4 images")
+    parser.add_argument("--image-size", default="640x480")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--channels-last", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--random-weights", action="store_true", help=argparse.SUPPRESS)
+    opt = parser.parse_args()
+
+    if opt.worker:
+        opt.threads, opt.interop = opt.threads[0], opt.interop[0]
+        worker(opt)
+        sys.exit()
+
+    cores = os.cpu_count() or 1
+    threads = opt.threads or sorted({1, max(cores // 2, 1), cores})
+    interop = opt.interop or [1, 2]
+    weights = opt.weights or random_checkpoint()
+
+    print(f"{'threads':>8}{'interop':>8}{'channels_last':>15}{'p50 (ms)':>10}{'images/s':>10}{'matched':>10}")
+    results = []
+    for t in threads:
+        for i in interop:
+            for channels_last in (False, True):
+                r = measure(weights, opt.weights is None, t, i, channels_last, opt)
+                assert r['matched'] == r['total'], \
+                    f"channels_last detections differ from NCHW ({r['matched']}/{r['total']} matched)"
+                results.append((r, channels_last))
+                matched = f"{r['matched']}/{r['total']}" if channels_last else '-'
+                print(f"{r['threads']:>8}{r['interop']:>8}{str(channels_last):>15}{r['p50'] * 1000:>10.1f}"
+                      f"{r['throughput']:>10.2f}{matched:>10}")
+
+    best, channels_last = max(results, key=lambda x: x[0]['throughput'])
+    print(f"\nBest throughput: MDP_TORCH_THREADS={best['threads']} MDP_TORCH_INTEROP_THREADS={best['interop']} "
+          f"MDP_CHANNELS_LAST={int(channels_last)}")
@@ -0,0 +1,80 @@
+"""
+Benchmark of the TorchScript export (export.py) against the eager PyTorch model, both loaded like load_model
+
+Reports the latency of the forward pass alone and of a full AutoShape call (pre-processing, forward, NMS), and
+checks that the exported model finds the same detections, for single images and batches. Without --weights a
+randomly initialised YOLOv5s checkpoint stands in for Week_9.pt (see bench_precision).
+
+Usage:
+    python -m bench.bench_torchscript
+    python -m bench.bench_torchscript --weights Week_9.pt --batch 1 4 --optimize
+"""
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+import torch
+
+from bench.bench_precision import compare, random_checkpoint
+from export import run as export
+
+
+def best_time(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def load(weights, random_weights):
+    model = torch.hub.load('./', 'custom', path=str(weights), source='local', device='cpu', verbose=False)
+    if random_weights:
+        model.conf, model.max_det = 2e-4, 50
+    return model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the TorchScript export against eager PyTorch")
+    parser.add_argument("--weights", default=None, help="checkpoint, a random YOLOv5s if not given")
+    parser.add_argument("--image-size", default="640x480", help="camera frame size, exported at its letterbox shape")
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--optimize", action="store_true", help="export with optimize_for_inference on load")
+    parser.add_argument("--repeat", type=int, default=5)
+    opt = parser.parse_args()
+
+    weights = opt.weights or random_checkpoint()
+    width, height = (int(v) for v in opt.image_size.split('x'))
+    # AutoShape letterboxes the longest side to 640 and rounds the other one up to the stride
+    gain = 640 / max(width, height)
+    imgsz = [int(np.ceil(v * gain / 32) * 32) for v in (height, width)]
+    exported = export(weights=weights, imgsz=imgsz, optimize=opt.optimize)
+
+    eager = load(weights, opt.weights is None)
+    traced = load(exported, opt.weights is None)
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(max(opt.batch))]
+
+    print(f"{'batch':>6}{'':>14}{'eager (ms)':>12}{'script (ms)':>13}{'speed-up':>10}{'matched':>10}")
+    for batch in opt.batch:
+        ims = images[:batch]
+        x = torch.rand(batch, 3, *imgsz)
+        for model in (eager, traced):
+            for _ in range(3):
+                model(ims)  # warm-up at this batch size, TorchScript profiles its first runs
+        with torch.inference_mode():
+            forward = [best_time(lambda: model.model(x), opt.repeat) for model in (eager, traced)]
+        full = [best_time(lambda: model(ims), opt.repeat) for model in (eager, traced)]
+
+        matched, total, ious = 0, 0, []
+        for ref, pred in zip(eager(ims).pred, traced(ims).pred):
+            m, i, _ = compare(ref, pred)
+            matched, total, ious = matched + m, total + len(ref), ious + i
+        assert matched == total and (not ious or statistics.mean(ious) > 0.999), \
+            f"TorchScript detections differ from eager ({matched}/{total} matched, batch {batch})"
+
+        for name, (e, t) in (("forward", forward), ("AutoShape", full)):
+            print(f"{batch:>6}{name:>14}{e * 1000:>12.1f}{t * 1000:>13.1f}{e / t:>9.2f}x{f'{matched}/{total}':>10}")
@@ -0,0 +1,95 @@
+import random
+from entities.Entity import Grid, Obstacle
+from consts import Direction, WIDTH, HEIGHT
+from helper import scale_cell
+
+# Minimum Chebyshev distance between two obstacles for each density
+DENSITY_SPACING = {
+    "sparse": 5,
+    "normal": 3,
+    "dense": 2,
+}
+
+# Cells the robot starts on (3x3 footprint at (1, 1)) plus a margin so it can leave the corner
+START_ZONE = 4
+
+OBSTACLE_DIRECTIONS = [Direction.NORTH, Direction.EAST, Direction.SOUTH, Direction.WEST]
+
+
+def is_valid_layout(obstacles: list, retrying: bool = False) -> bool:
+    """Checks that every obstacle of a layout has at least one reachable view position
+
+    Args:
+        obstacles: List of obstacle dicts with keys 'x', 'y', 'id', 'd'
+        retrying: Whether the layout is solved with the retrying view positions
+
+    Returns:
+        True if valid, False otherwise
+    """
+    grid = Grid(WIDTH, HEIGHT)
+    for ob in obstacles:
+        grid.add_obstacle(Obstacle(ob['x'], ob['y'], ob['d'], ob['id']))
+    return len(grid.obstacles) == len(obstacles) and all(grid.get_view_obstacle_positions(retrying))
+
+
+def generate_layout(rng: random.Random, n_obstacles: int, density: str = "normal", retrying: bool = False,
+                    max_attempts: int = 1000) -> dict:
+    """Generates a random valid /path request body
+
+    Args:
+        rng: Seeded random generator
+        n_obstacles: Number of obstacles to place
+        density: One of DENSITY_SPACING, controls how close obstacles may be to each other
+        retrying: Value of the 'retrying' flag of the layout
+        max_attempts: Number of layouts to try before giving up
+
+    Returns:
+        dict: /path request body
+    """
+    spacing = DENSITY_SPACING[density]
+
+    for _ in range(max_attempts):
+        obstacles = []
+        for _ in range(n_obstacles * 50):
+            if len(obstacles) == n_obstacles:
+                break
+            x, y = rng.randrange(WIDTH), rng.randrange(HEIGHT)
+            if x < START_ZONE and y < START_ZONE:
+                continue
+            if any(max(abs(ob['x'] - x), abs(ob['y'] - y)) < spacing for ob in obstacles):
+                continue
+            obstacles.append({"x": x, "y": y, "id": len(obstacles) + 1, "d": int(rng.choice(OBSTACLE_DIRECTIONS))})
+
+        if len(obstacles) == n_obstacles and is_valid_layout(obstacles, retrying):
+            return {
+                "obstacles": obstacles,
+                "robot_x": 1,
+                "robot_y": 1,
+                "robot_dir": int(Direction.NORTH),
+                "retrying": retrying,
+            }
+
+    raise ValueError(f"Could not generate a valid layout with {n_obstacles} {density} obstacles")
+
+
+def scale_layout(layout: dict, cell_size: int) -> dict:
+    """Converts a layout on the default CELL_SIZE grid to a finer grid
+
+    Every position moves to the cell at the center of its CELL_SIZE cell (helper.scale_cell), e.g. x=1 becomes x=3
+    with 5 cm cells.
+
+    Args:
+        layout: /path request body on the default grid
+        cell_size: Size of the new cells in cm, must divide CELL_SIZE
+
+    Returns:
+        dict: /path request body with 'cell_size' set
+    """
+    return dict(
+        layout,
+        obstacles=[dict(ob, x=scale_cell(ob['x'], cell_size), y=scale_cell(ob['y'], cell_size))
+                   for ob in layout['obstacles']],
+        robot_x=scale_cell(layout['robot_x'], cell_size),
+        robot_y=scale_cell(layout['robot_y'], cell_size),
+        cell_size=cell_size,
+    )
@@ -0,0 +1,148 @@
+"""
+Replays requests recorded by recorder.RequestRecorder (MDP_RECORD_DIR=<dir> python main.py) against the API
+
+Usage:
+    python -m bench.replay runs/recording                                # in-process, Flask test client
+    python -m bench.replay runs/recording --url http://localhost:5000 --concurrency 8 --repeat 5
+    python -m bench.replay runs/recording --endpoint /path --out runs/bench/replay.json
+"""
+
+import argparse
+import io
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.bench_planner import summarize
+from recorder import load_records
+
+
+class TestClientTarget:
+    """Sends requests to the Flask app in-process"""
+
+    def __init__(self):
+        # Imported here so that replaying against a URL does not load the app
+        from main import app
+        self.app = app
+        self._local = threading.local()
+
+    def _client(self):
+        # Test clients are not meant to be shared between threads
+        if not hasattr(self._local, "client"):
+            self._local.client = self.app.test_client()
+        return self._local.client
+
+    def send(self, record: dict, blob: bytes = None) -> int:
+        if record["endpoint"] == "/image":
+            data = {"file": (io.BytesIO(blob), record["filename"])}
+            response = self._client().post("/image", data=data, content_type="multipart/form-data")
+        else:
+            response = self._client().post(record["endpoint"], json=record["json"])
+        # Consume streamed responses so their full duration is measured
+        response.get_data()
+        return response.status_code
+
+
+class HTTPTarget:
+    """Sends requests to a running server"""
+
+    def __init__(self, url: str):
+        import requests
+        self.url = url.rstrip("/")
+        self.session = requests.Session()
+
+    def send(self, record: dict, blob: bytes = None) -> int:
+        if record["endpoint"] == "/image":
+            response = self.session.post(self.url + "/image", files={"file": (record["filename"], blob)})
+        else:
+            response = self.session.post(self.url + record["endpoint"], json=record["json"])
+        return response.status_code
+
+
+def replay(records: list, directory: str, target, concurrency: int = 1, repeat: int = 1) -> dict:
+    """Replays records against target and reports throughput and latency percentiles per endpoint
+
+    Args:
+        records: Records from recorder.load_records
+        directory: Recording directory, for the image blobs
+        target: TestClientTarget or HTTPTarget
+        concurrency: Number of requests in flight at a time
+        repeat: Number of times to replay the whole recording
+
+    Returns:
+        dict: {"requests", "seconds", "throughput", "endpoints": {endpoint: {"count", "errors", "latency"}}}
+    """
+    blobs = {}
+    for record in records:
+        if record["endpoint"] == "/image" and record["blob"] not in blobs:
+            with open(os.path.join(directory, "blobs", record["blob"]), "rb") as f:
+                blobs[record["blob"]] = f.read()
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    def send(record):
+        start = time.perf_counter()
+        try:
+            ok = target.send(record, blobs.get(record.get("blob"))) < 400
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies[record["endpoint"]].append(elapsed)
+            if not ok:
+                errors[record["endpoint"]] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, records * repeat))
+    seconds = time.perf_counter() - start
+
+    total = sum(len(v) for v in latencies.values())
+    return {
+        "requests": total,
+        "seconds": seconds,
+        "throughput": total / seconds if seconds else 0.0,
+        "endpoints": {
+            endpoint: {"count": len(values), "errors": errors[endpoint], "latency": summarize(values)}
+            for endpoint, values in sorted(latencies.items())
+        },
+    }
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser(description="Replay recorded /path and /image requests")
+    parser.add_argument("directory", type=str, help="recording directory (MDP_RECORD_DIR)")
+    parser.add_argument("--url", type=str, default="", help="server URL, replays in-process if empty")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=1, help="times to replay the recording")
+    parser.add_argument("--endpoint", type=str, nargs="+", default=None, help="only replay these endpoints")
+    parser.add_argument("--out", type=str, default="", help="JSON file to write the report to")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opt = parse_opt()
+    records = load_records(opt.directory)
+    if opt.endpoint:
+        records = [record for record in records if record["endpoint"] in opt.endpoint]
+
+    target = HTTPTarget(opt.url) if opt.url else TestClientTarget()
+    report = replay(records, opt.directory, target, opt.concurrency, opt.repeat)
+
+    print(f"{report['requests']} requests in {report['seconds']:.2f}s ({report['throughput']:.2f} req/s), "
+          f"concurrency {opt.concurrency}")
+    for endpoint, result in report["endpoints"].items():
+        latency = result["latency"]
+        print(f"{endpoint:<14} n={result['count']:<6} errors={result['errors']:<4} "
+              f"p50 {latency['p50'] * 1000:8.1f}ms  p95 {latency['p95'] * 1000:8.1f}ms  "
+              f"p99 {latency['p99'] * 1000:8.1f}ms")
+
+    if opt.out:
+        os.makedirs(os.path.dirname(opt.out) or ".", exist_ok=True)
+        with open(opt.out, "w") as f:
+            json.dump(report, f, indent=2)
@@ -29,6 +29,7 @@ EXPANDED_CELL = 1 # for both agent and obstacles
 
 WIDTH = 20
 HEIGHT = 20
+CELL_SIZE = 10 # cm per grid cell; distances in cells in this file (EXPANDED_CELL, TURN_RADIUS, ...) are at this size
 
 ITERATIONS = 2000
 TURN_RADIUS = 1
@@ -1,5 +1,6 @@
+from collections import defaultdict
 from typing import List
-from consts import Direction, EXPANDED_CELL, SCREENSHOT_COST
+from consts import Direction, EXPANDED_CELL, SCREENSHOT_COST, WIDTH, HEIGHT, CELL_SIZE
 from helper import is_valid
 
 
@@ -77,11 +78,15 @@ class Obstacle(CellState):
         """
         return self.x == other.x and self.y == other.y and self.direction == other.direction
 
-    def get_view_state(self, retrying: bool) -> List[CellState]:
+    def get_view_state(self, retrying: bool, size_x: int = WIDTH, size_y: int = HEIGHT,
+                       scale: int = 1) -> List[CellState]:
         """Constructs the list of CellStates from which the robot can view the symbol on the obstacle.
 
         Args:
             retrying: Whether this is a retry attempt (uses farther positions)
+            size_x: Arena width in cells
+            size_y: Arena height in cells
+            scale: Cells per CELL_SIZE cm (see Grid), the view offsets are scaled by it
 
         Returns:
             List[CellState]: Valid cell states where robot can be positioned to view the symbol
@@ -119,7 +124,9 @@ class Obstacle(CellState):
             ]
         
         for primary_offset, secondary_offsets, penalty in positions:
+            primary_offset *= scale
             for sec_offset in secondary_offsets:
+                sec_offset *= scale
                 if axis == 'y':
                     nx = self.x + sec_offset
                     ny = self.y + dy_sign * primary_offset
@@ -127,25 +134,40 @@ class Obstacle(CellState):
                     nx = self.x + dx_sign * primary_offset
                     ny = self.y + sec_offset
                 
-                if is_valid(nx, ny):
+                if is_valid(nx, ny, size_x, size_y, EXPANDED_CELL * scale):
                     cells.append(CellState(nx, ny, robot_dir, self.obstacle_id, penalty))
         
         return cells
 
 
+# Obstacles further than this (Chebyshev distance, in CELL_SIZE cells) never affect reachable or the safe cost
+NEAR_RADIUS = 4
+
+
 class Grid:
     """
     Grid object that contains the size of the grid and a list of obstacles
     """
-    def __init__(self, size_x: int, size_y: int):
+    def __init__(self, size_x: int, size_y: int, cell_size: int = CELL_SIZE):
         """
         Args:
             size_x (int): Size of the grid in the x direction
             size_y (int): Size of the grid in the y direction
+            cell_size (int): Size of a cell in cm, must divide CELL_SIZE
         """
+        if cell_size <= 0 or CELL_SIZE % cell_size:
+            raise ValueError(f"cell_size must divide {CELL_SIZE}, got {cell_size}")
         self.size_x = size_x
         self.size_y = size_y
+        self.cell_size = cell_size
+        # Cells per CELL_SIZE cm: distances in consts.py are multiplied by it
+        self.scale = CELL_SIZE // cell_size
         self.obstacles: List[Obstacle] = []
+        # (x, y, direction) of every obstacle, for duplicate checks
+        self.obstacle_keys = set()
+        # Coarse buckets of near_radius cells: bucket -> obstacles within near_radius of any of its cells
+        self.near_radius = NEAR_RADIUS * self.scale
+        self.near_buckets = defaultdict(list)
 
     def add_obstacle(self, obstacle: Obstacle):
         """Add a new obstacle to the Grid object, ignores if duplicate obstacle
@@ -153,21 +175,38 @@ class Grid:
         Args:
             obstacle (Obstacle): Obstacle to be added
         """
-        # Loop through the existing obstacles to check for duplicates
-        to_add = True
-        for ob in self.obstacles:
-            if ob == obstacle:
-                to_add = False
-                break
+        key = (obstacle.x, obstacle.y, obstacle.direction)
+        if key in self.obstacle_keys:
+            return
+
+        self.obstacle_keys.add(key)
+        self.obstacles.append(obstacle)
 
-        if to_add:
-            self.obstacles.append(obstacle)
+        r = self.near_radius
+        for bx in range((obstacle.x - r) // r, (obstacle.x + r) // r + 1):
+            for by in range((obstacle.y - r) // r, (obstacle.y + r) // r + 1):
+                self.near_buckets[(bx, by)].append(obstacle)
 
     def reset_obstacles(self):
         """
         Resets the obstacles in the grid
         """
         self.obstacles = []
+        self.obstacle_keys = set()
+        self.near_buckets = defaultdict(list)
+
+    def obstacles_near(self, x: int, y: int) -> List[Obstacle]:
+        """Obstacles that may be within near_radius cells of (x, y), in a single lookup
+
+        Args:
+            x (int): x-coordinate
+            y (int): y-coordinate
+
+        Returns:
+            List[Obstacle]: Superset of the obstacles within near_radius (Chebyshev distance), do not modify
+        """
+        r = self.near_radius
+        return self.near_buckets.get((x // r, y // r), [])
 
     def get_obstacles(self):
         """
@@ -193,23 +232,24 @@ class Grid:
         if not self.is_valid_coord(x, y):
             return False
 
-        for ob in self.obstacles:
+        scale = self.scale
+        for ob in self.obstacles_near(x, y):
             # Special-case bypass for bottom-left start corridor
-            if ob.x == 4 and ob.y <= 4 and x < 4 and y < 4:
+            if 4 * scale <= ob.x < 5 * scale and ob.y < 5 * scale and x < 4 * scale and y < 4 * scale:
                 continue
 
             # Must be at least 4 units away in total (x+y)
-            if abs(ob.x - x) + abs(ob.y - y) >= 4:
+            if abs(ob.x - x) + abs(ob.y - y) >= 4 * scale:
                 continue
             # Stricter buffer near turns
             if turn:
-                if max(abs(ob.x - x), abs(ob.y - y)) < EXPANDED_CELL * 2 + 1:
+                if max(abs(ob.x - x), abs(ob.y - y)) < (EXPANDED_CELL * 2 + 1) * scale:
                     return False
             if pre_turn:
-                if max(abs(ob.x - x), abs(ob.y - y)) < EXPANDED_CELL * 2 + 1:
+                if max(abs(ob.x - x), abs(ob.y - y)) < (EXPANDED_CELL * 2 + 1) * scale:
                     return False
             else:
-                if max(abs(ob.x - x), abs(ob.y - y)) < 2:
+                if max(abs(ob.x - x), abs(ob.y - y)) < 2 * scale:
                     return False
 
         return True
@@ -224,7 +264,8 @@ class Grid:
         Returns:
             bool: True if valid, False otherwise
         """
-        if x < 1 or x >= self.size_x - 1 or y < 1 or y >= self.size_y - 1:
+        margin = EXPANDED_CELL * self.scale
+        if x < margin or x >= self.size_x - margin or y < margin or y >= self.size_y - margin:
             return False
 
         return True
@@ -253,7 +294,7 @@ class Grid:
                 continue
             else:
                 view_states = [view_state for view_state in obstacle.get_view_state(
-                    retrying) if self.reachable(view_state.x, view_state.y)]
+                    retrying, self.size_x, self.size_y, self.scale) if self.reachable(view_state.x, view_state.y)]
             optimal_positions.append(view_states)
 
         return optimal_positions
\ No newline at end of file
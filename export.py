@@ -0,0 +1,83 @@
+# YOLOv5 🚀 by Ultralytics, GPL-3.0 license
+"""
+Export a YOLOv5 PyTorch model to TorchScript, for DetectMultiBackend / torch.hub 'custom' loading
+
+The fused model is traced at a fixed input shape and frozen. The export only runs images letterboxed to that shape:
+the Pi's 640x480 frames at AutoShape's default size=640 give 480x640 (--imgsz 480 640). Any batch size works.
+
+With --optimize, DetectMultiBackend also runs torch.jit.optimize_for_inference on the model when loading it on CPU
+(the optimized graph holds oneDNN weights that cannot be saved). Check it with bench/bench_torchscript.py first: it
+can be slower than the frozen graph.
+
+Usage:
+    $ python export.py --weights Week_9.pt --imgsz 480 640 [--optimize]
+    $ MDP_WEIGHTS=Week_9.torchscript python main.py
+"""
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+import torch
+
+from models.experimental import attempt_load
+from models.yolo import Detect
+from utils.general import LOGGER, colorstr, file_size
+from utils.torch_utils import select_device, smart_inference_mode
+
+
+def export_torchscript(model, im, file, optimize=False, metadata=None, prefix=colorstr('TorchScript:')):
+    # YOLOv5 TorchScript model export: traced at im.shape and frozen. optimize is stored in the metadata and applied
+    # when loading, as optimize_for_inference graphs cannot be loaded back. metadata updates the saved config.txt
+    LOGGER.info(f'\n{prefix} starting export with torch {torch.__version__}...')
+    f = Path(file).with_suffix('.torchscript')
+
+    ts = torch.jit.freeze(torch.jit.trace(model, im, strict=False).eval())
+    # shape (H, W) is the only input size the traced Detect grids are valid for, the batch size may vary
+    d = {'shape': list(im.shape), 'stride': int(max(model.stride)), 'names': model.names, 'precision': 'fp32',
+         'optimize': optimize, **(metadata or {})}
+    ts.save(str(f), _extra_files={'config.txt': json.dumps(d)})
+    LOGGER.info(f'{prefix} export success ✅ saved as {f} ({file_size(f):.1f} MB)')
+    return f
+
+
+@smart_inference_mode()
+def run(weights='Week_9.pt', imgsz=(480, 640), batch_size=1, device='cpu', optimize=False):
+    t = time.time()
+    device = select_device(device)
+    model = attempt_load(weights, device=device, inplace=True, fuse=True)  # load FP32 model, Conv+BN fused
+    imgsz = [imgsz] if isinstance(imgsz, int) else list(imgsz)
+    imgsz *= 2 if len(imgsz) == 1 else 1  # expand
+    assert all(x % int(max(model.stride)) == 0 for x in imgsz), f'--imgsz {imgsz} must be multiples of the stride'
+    im = torch.zeros(batch_size, 3, *imgsz).to(device)  # image size(1,3,480,640) BCHW
+
+    model.eval()
+    for m in model.modules():
+        if isinstance(m, Detect):
+            m.inplace = False  # safe multithread inference, as in AutoShape
+            m.export = True  # inference output only
+    for _ in range(2):
+        model(im)  # dry runs, build the Detect grids at imgsz
+
+    f = export_torchscript(model, im, weights, optimize)
+    LOGGER.info(f'\nExport complete ({time.time() - t:.1f}s)'
+                f"\nResults saved to {colorstr('bold', os.path.abspath(f))}"
+                f"\nLoad:            torch.hub.load('./', 'custom', path='{f}', source='local')")
+    return f
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', type=str, default='Week_9.pt', help='model.pt path')
+    parser.add_argument('--imgsz', '--img', '--img-size', nargs='+', type=int, default=[480, 640], help='image (h, w)')
+    parser.add_argument('--batch-size', type=int, default=1, help='batch size traced')
+    parser.add_argument('--device', default='cpu', help='cuda device, i.e. 0 or 0,1,2,3 or cpu')
+    parser.add_argument('--optimize', action='store_true', help='run optimize_for_inference when loading on CPU')
+    opt = parser.parse_args()
+    return opt
+
+
+if __name__ == '__main__':
+    run(**vars(parse_opt()))
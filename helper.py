@@ -1,22 +1,41 @@
-from consts import WIDTH, HEIGHT, Direction
+import struct
+from typing import NamedTuple
+from consts import WIDTH, HEIGHT, CELL_SIZE, Direction
 
 # Default speed for motor commands (0-100, multiplied by 71 for PWM 0-7199)
 DEFAULT_SPEED = 50
-# Global command ID counter for motor protocol
-_cmd_id = 1
 
 
-def is_valid(center_x: int, center_y: int) -> bool:
+def is_valid(center_x: int, center_y: int, size_x: int = WIDTH, size_y: int = HEIGHT, margin: int = 1) -> bool:
     """Checks if given position is within bounds
 
     Args:
         center_x: x-coordinate
         center_y: y-coordinate
+        size_x: Arena width in cells
+        size_y: Arena height in cells
+        margin: Cells the robot extends past its center
 
     Returns:
         True if valid, False otherwise
     """
-    return 0 < center_x < WIDTH - 1 and 0 < center_y < HEIGHT - 1
+    return margin <= center_x < size_x - margin and margin <= center_y < size_y - margin
+
+
+def scale_cell(value: int, cell_size: int) -> int:
+    """Converts a cell of the default CELL_SIZE grid to the cell at its center on a grid of cell_size
+
+    e.g. cell 1 becomes cell 3 with 5 cm cells, and stays cell 1 with 10 cm cells.
+
+    Args:
+        value: x or y cell on the CELL_SIZE grid
+        cell_size: Size of the new cells in cm, must divide CELL_SIZE
+
+    Returns:
+        The x or y cell on the cell_size grid
+    """
+    scale = CELL_SIZE // cell_size
+    return value * scale + scale // 2
 
 
 def _get_snap_command(screenshot_id: int, obstacle: dict, robot_position) -> str:
@@ -30,6 +49,20 @@ def _get_snap_command(screenshot_id: int, obstacle: dict, robot_position) -> str
     Returns:
         SNAP command string like 'SNAP1_L', 'SNAP1_C', or 'SNAP1_R'
     """
+    return f"SNAP{_get_snap_label(screenshot_id, obstacle, robot_position)}"
+
+
+def _get_snap_label(screenshot_id: int, obstacle: dict, robot_position) -> str:
+    """Generate the SNAP target and direction suffix based on obstacle and robot positions.
+    
+    Args:
+        screenshot_id: ID of the obstacle to photograph
+        obstacle: Dict with obstacle info {'x', 'y', 'd', 'id'}
+        robot_position: Current robot state with x, y, direction
+    
+    Returns:
+        Label like '1_L', '1_C', or '1_R'
+    """
     ob_d = obstacle['d']
     robot_d = robot_position.direction
     
@@ -44,32 +77,133 @@ def _get_snap_command(screenshot_id: int, obstacle: dict, robot_position) -> str
     
     key = (ob_d, robot_d)
     if key not in direction_map:
-        return f"SNAP{screenshot_id}"
+        return f"{screenshot_id}"
     
     attr, left_when_greater, right_when_greater = direction_map[key]
     ob_val = obstacle[attr]
     robot_val = getattr(robot_position, attr)
     
     if ob_val == robot_val:
-        return f"SNAP{screenshot_id}_C"
+        return f"{screenshot_id}_C"
     elif ob_val > robot_val:
         suffix = '_L' if left_when_greater else '_R'
     else:
         suffix = '_R' if left_when_greater else '_L'
     
-    return f"SNAP{screenshot_id}{suffix}"
+    return f"{screenshot_id}{suffix}"
+
+
+# Longest FWD/REV command the motor protocol takes, in 10 cm steps
+MAX_STRAIGHT_STEPS = 9
+MAX_STRAIGHT_DISTANCE = MAX_STRAIGHT_STEPS * CELL_SIZE
+
+# Direction -> (dx, dy) of a forward step; a straight step along it is FWD, anything else is REV
+FORWARD_STEP = {
+    Direction.NORTH: (0, 1),
+    Direction.EAST: (1, 0),
+    Direction.SOUTH: (0, -1),
+    Direction.WEST: (-1, 0),
+}
+
+# (previous direction, new direction) -> (turn if y increased, turn otherwise)
+TURN_TABLE = {
+    (Direction.NORTH, Direction.EAST): ("TURN90R", "TURN90L"),
+    (Direction.NORTH, Direction.WEST): ("TURN90L", "TURN90R"),
+    (Direction.EAST, Direction.NORTH): ("TURN90L", "TURN90R"),
+    (Direction.EAST, Direction.SOUTH): ("TURN90L", "TURN90R"),
+    (Direction.SOUTH, Direction.EAST): ("TURN90R", "TURN90L"),
+    (Direction.SOUTH, Direction.WEST): ("TURN90L", "TURN90R"),
+    (Direction.WEST, Direction.NORTH): ("TURN90R", "TURN90L"),
+    (Direction.WEST, Direction.SOUTH): ("TURN90R", "TURN90L"),
+}
+
+
+class Command(NamedTuple):
+    """A single command of the robot command stream, rendered to its protocol string by render()
+
+    op is one of FWD, REV, TURN90L, TURN90R, STOP (motor commands) or SNAP, FIN (markers).
+    """
+    op: str
+    cmd_id: int = 0
+    speed: int = 0
+    value: int = 0
+    # SNAP target and framing, e.g. '1_C'
+    label: str = ''
+    # (first, last) index of the path states the command moves through, None if it does not move the robot
+    path_range: tuple = None
+    # True for turns driven in reverse; the protocol string does not carry it
+    reverse: bool = False
+
+    def render(self) -> str:
+        if self.op == "SNAP":
+            return f"SNAP{self.label}"
+        if self.op == "FIN":
+            return "FIN"
+        return f":{self.cmd_id}/MOTOR/{self.op}/{self.speed}/{self.value};"
 
 
-def command_generator(states: list, obstacles: list, speed: int = None) -> list:
+def render_commands(commands: list) -> list:
+    """Renders Command records to motor protocol strings"""
+    return [command.render() for command in commands]
+
+
+def command_generator(states: list, obstacles: list, speed: int = None, return_ranges: bool = False,
+                      cell_size: int = CELL_SIZE):
     """Takes in a list of states and generates a list of motor protocol commands for the robot to follow.
     
     Args:
         states: List of State objects representing robot path
         obstacles: List of obstacles, each a dict with keys 'x', 'y', 'd', 'id'
         speed: Motor speed (0-100). If None, uses DEFAULT_SPEED
+        return_ranges: Also return the range of path states each command covers
+        cell_size: Size of a path cell in cm
 
     Returns:
         List of motor protocol command strings in format :[cmdId]/[component]/[command]/[param1]/[param2];
+        with return_ranges, a (commands, ranges) tuple where ranges[k] is the (first, last) index into states
+        of commands[k], or None for commands that do not move the robot (SNAP, STOP, FIN)
+    """
+    records = [command for leg in iter_command_records(states, obstacles, speed, cell_size) for command in leg]
+    commands = render_commands(records)
+    if return_ranges:
+        return commands, [command.path_range for command in records]
+    return commands
+
+
+def iter_command_legs(states: list, obstacles: list, speed: int = None, cell_size: int = CELL_SIZE):
+    """Generates the same commands as command_generator, but yields them leg by leg.
+
+    A leg ends with the SNAP command of the obstacle it visits; the final leg ends with the STOP command and
+    the FIN marker. Command IDs continue across legs, so concatenating every leg gives command_generator's output.
+
+    Args:
+        states: List of State objects representing robot path
+        obstacles: List of obstacles, each a dict with keys 'x', 'y', 'd', 'id'
+        speed: Motor speed (0-100). If None, uses DEFAULT_SPEED
+        cell_size: Size of a path cell in cm
+
+    Yields:
+        List of compressed motor protocol command strings for one leg
+    """
+    for leg in iter_command_records(states, obstacles, speed, cell_size):
+        yield render_commands(leg)
+
+
+def iter_command_records(states: list, obstacles: list, speed: int = None, cell_size: int = CELL_SIZE):
+    """Generates the commands for a path as Command records, leg by leg, in a single pass.
+
+    Consecutive straight steps in the same direction are run-length encoded into one FWD/REV command of up to
+    MAX_STRAIGHT_DISTANCE units (cm). Every cell step and every turn consumes one command ID, so a merged command
+    keeps the ID of its first step and the next command skips the IDs of the merged steps.
+
+    Args:
+        states: Iterable of State objects representing robot path
+        obstacles: List of obstacles, each a dict with keys 'x', 'y', 'd', 'id'
+        speed: Motor speed (0-100). If None, uses DEFAULT_SPEED
+        cell_size: Size of a path cell in cm, the length of one straight step
+
+    Yields:
+        List of Command records for one leg (see iter_command_legs)
     """
 
     # Convert the list of obstacles into a dictionary with key as the obstacle id and value as the obstacle
@@ -77,174 +211,211 @@ def command_generator(states: list, obstacles: list, speed: int = None) -> list:
     
     # Use provided speed or default
     motor_speed = speed if speed is not None else DEFAULT_SPEED
-    
-    # Initialize commands list and command ID counter
-    commands = []
-    global _cmd_id
+
+    max_steps = MAX_STRAIGHT_DISTANCE // cell_size
+
+    leg = []
     cmd_id = 1
+    # Current FWD/REV run: op, ID of its first step, number of steps, index of the state it starts from
+    run_op, run_id, run_steps, run_start = None, 0, 0, 0
 
-    # Iterate through each state in the list of states
-    for i in range(1, len(states)):
-        steps = "00"
-
-        # If previous state and current state are the same direction,
-        if states[i].direction == states[i - 1].direction:
-            # Forward - Must be (east facing AND x value increased) OR (north facing AND y value increased)
-            if (states[i].x > states[i - 1].x and states[i].direction == Direction.EAST) or (states[i].y > states[i - 1].y and states[i].direction == Direction.NORTH):
-                commands.append(f":{cmd_id}/MOTOR/FWD/{motor_speed}/10;")
-                cmd_id += 1
-            # Forward - Must be (west facing AND x value decreased) OR (south facing AND y value decreased)
-            elif (states[i].x < states[i-1].x and states[i].direction == Direction.WEST) or (
-                    states[i].y < states[i-1].y and states[i].direction == Direction.SOUTH):
-                commands.append(f":{cmd_id}/MOTOR/FWD/{motor_speed}/10;")
-                cmd_id += 1
-            # Backward - All other cases where the previous and current state is the same direction
-            else:
-                commands.append(f":{cmd_id}/MOTOR/REV/{motor_speed}/10;")
-                cmd_id += 1
-
-            # If any of these states has a valid screenshot ID, add a SNAP command
-            if states[i].screenshot_id != -1:
-                snap_cmd = _get_snap_command(
-                    states[i].screenshot_id,
-                    obstacles_dict[states[i].screenshot_id],
-                    states[i]
-                )
-                commands.append(snap_cmd)
-            continue
-
-        # If previous state and current state are not the same direction, it means that there will be a turn command involved
-        # Assume there are 4 turning command: FR, FL, BL, BR (the turn command will turn the robot 90 degrees)
-        # FR00 | FR30: Forward Right;
-        # FL00 | FL30: Forward Left;
-        # BR00 | BR30: Backward Right;
-        # BL00 | BL30: Backward Left;
-
-        # Facing north previously
-        if states[i - 1].direction == Direction.NORTH:
-            # Facing east afterwards
-            if states[i].direction == Direction.EAST:
-                # y value increased -> Forward Right
-                if states[i].y > states[i - 1].y:
-                    commands.append(f":{cmd_id}/MOTOR/TURN90R/{motor_speed}/0;")
-                    cmd_id += 1
-                # y value decreased -> Backward Left
-                else:
-                    commands.append(f":{cmd_id}/MOTOR/TURN90L/{motor_speed}/0;")
-                    cmd_id += 1
-            # Facing west afterwards
-            elif states[i].direction == Direction.WEST:
-                # y value increased -> Forward Left
-                if states[i].y > states[i - 1].y:
-                    commands.append(f":{cmd_id}/MOTOR/TURN90L/{motor_speed}/0;")
-                    cmd_id += 1
-                # y value decreased -> Backward Right
-                else:
-                    commands.append(f":{cmd_id}/MOTOR/TURN90R/{motor_speed}/0;")
-                    cmd_id += 1
-            else:
-                raise Exception("Invalid turing direction")
-
-        elif states[i - 1].direction == Direction.EAST:
-            if states[i].direction == Direction.NORTH:
-                if states[i].y > states[i - 1].y:
-                    commands.append(f":{cmd_id}/MOTOR/TURN90L/{motor_speed}/0;")
-                    cmd_id += 1
-                else:
-                    commands.append(f":{cmd_id}/MOTOR/TURN90R/{motor_speed}/0;")
-                    cmd_id += 1
-
-            elif states[i].direction == Direction.SOUTH:
-                if states[i].y > states[i - 1].y:
-                    commands.append(f":{cmd_id}/MOTOR/TURN90L/{motor_speed}/0;")
-                    cmd_id += 1
-                else:
-                    commands.append(f":{cmd_id}/MOTOR/TURN90R/{motor_speed}/0;")
-                    cmd_id += 1
+    # Consumed lazily, so states can be a generator (see MazeSolver.iter_optimal_order_dp) and each leg is
+    # yielded as soon as the state with its SNAP arrives
+    states = iter(states)
+    prev = next(states, None)
+    for i, cur in enumerate(states, 1):
+        if cur.direction == prev.direction:
+            fx, fy = FORWARD_STEP.get(cur.direction, (0, 0))
+            op = "FWD" if (cur.x - prev.x) * fx + (cur.y - prev.y) * fy > 0 else "REV"
+            if op == run_op and run_steps < max_steps:
+                run_steps += 1
             else:
-                raise Exception("Invalid turing direction")
-
-        elif states[i - 1].direction == Direction.SOUTH:
-            if states[i].direction == Direction.EAST:
-                if states[i].y > states[i - 1].y:
-                    commands.append(f":{cmd_id}/MOTOR/TURN90R/{motor_speed}/0;")
-                    cmd_id += 1
-                else:
-                    commands.append(f":{cmd_id}/MOTOR/TURN90L/{motor_speed}/0;")
-                    cmd_id += 1
-            elif states[i].direction == Direction.WEST:
-                if states[i].y > states[i - 1].y:
-                    commands.append(f":{cmd_id}/MOTOR/TURN90L/{motor_speed}/0;")
-                    cmd_id += 1
-                else:
-                    commands.append(f":{cmd_id}/MOTOR/TURN90R/{motor_speed}/0;")
-                    cmd_id += 1
-            else:
-                raise Exception("Invalid turing direction")
-
-        elif states[i - 1].direction == Direction.WEST:
-            if states[i].direction == Direction.NORTH:
-                if states[i].y > states[i - 1].y:
-                    commands.append(f":{cmd_id}/MOTOR/TURN90R/{motor_speed}/0;")
-                    cmd_id += 1
-                else:
-                    commands.append(f":{cmd_id}/MOTOR/TURN90L/{motor_speed}/0;")
-                    cmd_id += 1
-            elif states[i].direction == Direction.SOUTH:
-                if states[i].y > states[i - 1].y:
-                    commands.append(f":{cmd_id}/MOTOR/TURN90R/{motor_speed}/0;")
-                    cmd_id += 1
-                else:
-                    commands.append(f":{cmd_id}/MOTOR/TURN90L/{motor_speed}/0;")
-                    cmd_id += 1
-            else:
-                raise Exception("Invalid turing direction")
+                if run_op:
+                    leg.append(Command(run_op, run_id, motor_speed, run_steps * cell_size, '',
+                                       (run_start, run_start + run_steps)))
+                run_op, run_id, run_steps, run_start = op, cmd_id, 1, i - 1
         else:
-            raise Exception("Invalid position")
+            turns = TURN_TABLE.get((prev.direction, cur.direction))
+            if turns is None:
+                if prev.direction in FORWARD_STEP:
+                    raise Exception("Invalid turing direction")
+                raise Exception("Invalid position")
+            if run_op:
+                leg.append(Command(run_op, run_id, motor_speed, run_steps * cell_size, '',
+                                   (run_start, run_start + run_steps)))
+                run_op = None
+            hx, hy = FORWARD_STEP[prev.direction]
+            leg.append(Command(turns[0] if cur.y > prev.y else turns[1], cmd_id, motor_speed, 0, '', (i - 1, i),
+                               (cur.x - prev.x) * hx + (cur.y - prev.y) * hy < 0))
+        cmd_id += 1
+
+        # If this state has a valid screenshot ID, add a SNAP command, which closes the leg
+        if cur.screenshot_id != -1:
+            if run_op:
+                leg.append(Command(run_op, run_id, motor_speed, run_steps * cell_size, '',
+                                   (run_start, run_start + run_steps)))
+                run_op = None
+            label = _get_snap_label(cur.screenshot_id, obstacles_dict[cur.screenshot_id], cur)
+            leg.append(Command("SNAP", label=label))
+            yield leg
+            leg = []
+        prev = cur
 
-        # If any of these states has a valid screenshot ID, add a SNAP command
-        if states[i].screenshot_id != -1:
-            snap_cmd = _get_snap_command(
-                states[i].screenshot_id,
-                obstacles_dict[states[i].screenshot_id],
-                states[i]
-            )
-            commands.append(snap_cmd)
+    if run_op:
+        leg.append(Command(run_op, run_id, motor_speed, run_steps * cell_size, '', (run_start, run_start + run_steps)))
 
     # Final command is the stop command
-    commands.append(f":{cmd_id}/MOTOR/STOP/0/0;")
-    cmd_id += 1
-    commands.append("FIN")  # Keep FIN marker for higher-level processing
-
-    # Compress commands if there are consecutive forward or backward commands
-    compressed_commands = [commands[0]]
-
-    for i in range(1, len(commands)):
-        # If both commands are REV (backward)
-        if "/MOTOR/REV/" in commands[i] and "/MOTOR/REV/" in compressed_commands[-1]:
-            # Extract distance from previous command
-            parts = compressed_commands[-1].split("/")
-            distance = int(parts[-1].rstrip(";"))
-            # If distance is not 90, add 10 to the distance
-            if distance != 90:
-                cmd_parts = compressed_commands[-1].split("/")
-                cmd_parts[-1] = f"{distance + 10};"
-                compressed_commands[-1] = "/".join(cmd_parts)
-                continue
+    leg.append(Command("STOP", cmd_id))
+    leg.append(Command("FIN"))  # Keep FIN marker for higher-level processing
+    yield leg
+
+
+# Longest straight move optimize_commands will emit by default: the length of the arena
+MAX_OPTIMIZED_DISTANCE = max(WIDTH, HEIGHT) * CELL_SIZE
 
-        # If both commands are FWD (forward)
-        elif "/MOTOR/FWD/" in commands[i] and "/MOTOR/FWD/" in compressed_commands[-1]:
-            # Extract distance from previous command
-            parts = compressed_commands[-1].split("/")
-            distance = int(parts[-1].rstrip(";"))
-            # If distance is not 90, add 10 to the distance
-            if distance != 90:
-                cmd_parts = compressed_commands[-1].split("/")
-                cmd_parts[-1] = f"{distance + 10};"
-                compressed_commands[-1] = "/".join(cmd_parts)
+
+def optimize_commands(commands: list, max_distance: int = MAX_OPTIMIZED_DISTANCE) -> list:
+    """Post-generation pass that minimises the number of motor commands (each one is a round trip to the STM).
+
+    Adjacent straight moves are folded into their net move: FWD/FWD and REV/REV runs are merged past the
+    90 unit cap of command_generator up to max_distance, and FWD/REV pairs cancel out (and are dropped if the
+    net move is zero). Nothing is merged across a turn or a SNAP, since the robot has to stop at the SNAP pose.
+    A merged command keeps the ID of its first command.
+
+    Args:
+        commands: List of Command records, e.g. from iter_command_records
+        max_distance: Longest straight move the motor protocol accepts
+
+    Returns:
+        List of Command records
+    """
+    optimized = []
+    for command in commands:
+        if command.op in ("FWD", "REV") and optimized and optimized[-1].op in ("FWD", "REV") \
+                and optimized[-1].speed == command.speed:
+            prev = optimized[-1]
+            net = (prev.value if prev.op == "FWD" else -prev.value) + \
+                  (command.value if command.op == "FWD" else -command.value)
+            if abs(net) <= max_distance:
+                optimized.pop()
+                if net != 0:
+                    path_range = (prev.path_range[0], command.path_range[1]) \
+                        if prev.path_range and command.path_range else None
+                    optimized.append(Command("FWD" if net > 0 else "REV", prev.cmd_id, prev.speed, abs(net), '',
+                                             path_range))
                 continue
-        
-        # Otherwise, just add as usual
-        compressed_commands.append(commands[i])
+        optimized.append(command)
+    return optimized
+
+# Compact binary encoding of a command stream, for the Raspberry Pi link.
+# Header: magic b'MC', version (u8), number of commands (u16)
+# Command: opcode (u8), speed (u8), value (u16), cmd_id (u16), all little-endian
+# SNAP stores the obstacle ID in value and the framing (SNAP_FRAMING) in the speed field
+COMMANDS_MIMETYPE = "application/x-mdp-commands"
+_BINARY_MAGIC = b"MC"
+_BINARY_VERSION = 1
+_BINARY_HEADER = struct.Struct("<2sBH")
+_BINARY_COMMAND = struct.Struct("<BBHH")
+OPCODES = {"FWD": 1, "REV": 2, "TURN90L": 3, "TURN90R": 4, "STOP": 5, "SNAP": 6, "FIN": 7}
+_OPS = {code: op for op, code in OPCODES.items()}
+SNAP_FRAMING = {"": 0, "_L": 1, "_C": 2, "_R": 3}
+_FRAMINGS = {code: suffix for suffix, code in SNAP_FRAMING.items()}
+
+
+def parse_command(command: str) -> Command:
+    """Parses a protocol string (':1/MOTOR/FWD/50/30;', 'SNAP1_C', 'FIN') back into a Command record"""
+    if command == "FIN":
+        return Command("FIN")
+    if command.startswith("SNAP"):
+        return Command("SNAP", label=command[4:])
+    cmd_id, _, op, speed, value = command[1:].rstrip(";").split("/")
+    return Command(op, int(cmd_id), int(speed), int(value))
+
+
+def _check_binary_field(command: Command, name: str, value: int, limit: int):
+    """Raises ValueError if value does not fit an unsigned field of the binary format"""
+    if not 0 <= value <= limit:
+        raise ValueError(f"{name} {value} of {command.render()} does not fit the binary command format (0-{limit})")
 
-    return compressed_commands
+
+def encode_commands(commands: list) -> bytes:
+    """Encodes a command stream into the compact binary format
+
+    Args:
+        commands: List of Command records or protocol strings
+
+    Returns:
+        bytes: header followed by one fixed-width record per command
+
+    Raises:
+        ValueError: if a value, speed, command ID or obstacle ID is outside its unsigned field, or there are more
+            than 65535 commands. The JSON command list has no such limits
+    """
+    if len(commands) > 0xFFFF:
+        raise ValueError(f"{len(commands)} commands do not fit the binary command format (0-65535)")
+    chunks = [_BINARY_HEADER.pack(_BINARY_MAGIC, _BINARY_VERSION, len(commands))]
+    for command in commands:
+        if isinstance(command, str):
+            command = parse_command(command)
+        if command.op == "SNAP":
+            obstacle_id, _, framing = command.label.partition("_")
+            _check_binary_field(command, "obstacle ID", int(obstacle_id), 0xFFFF)
+            chunks.append(_BINARY_COMMAND.pack(OPCODES["SNAP"], SNAP_FRAMING["_" + framing if framing else ""],
+                                               int(obstacle_id), 0))
+        else:
+            _check_binary_field(command, "speed", command.speed, 0xFF)
+            _check_binary_field(command, "value", command.value, 0xFFFF)
+            _check_binary_field(command, "command ID", command.cmd_id, 0xFFFF)
+            chunks.append(_BINARY_COMMAND.pack(OPCODES[command.op], command.speed, command.value, command.cmd_id))
+    return b"".join(chunks)
+
+
+def decode_commands(data: bytes) -> list:
+    """Decodes the compact binary format back into Command records
+
+    Args:
+        data: bytes produced by encode_commands
+
+    Returns:
+        List of Command records (without path ranges)
+    """
+    magic, version, count = _BINARY_HEADER.unpack_from(data, 0)
+    if magic != _BINARY_MAGIC or version != _BINARY_VERSION:
+        raise ValueError(f"Not a version {_BINARY_VERSION} command stream")
+    if len(data) != _BINARY_HEADER.size + count * _BINARY_COMMAND.size:
+        raise ValueError(f"Expected {count} commands, got {len(data) - _BINARY_HEADER.size} bytes of commands")
+
+    commands = []
+    for opcode, speed, value, cmd_id in _BINARY_COMMAND.iter_unpack(data[_BINARY_HEADER.size:]):
+        op = _OPS[opcode]
+        if op == "SNAP":
+            commands.append(Command("SNAP", label=f"{value}{_FRAMINGS[speed]}"))
+        else:
+            commands.append(Command(op, cmd_id, speed, value))
+    return commands
+
+
+if __name__ == "__main__":
+    import json
+
+    # Round trip of the binary encoding: strings -> bytes -> records -> strings
+    from entities.Entity import CellState
+
+    states = [CellState(1, 1, Direction.NORTH), CellState(1, 2, Direction.NORTH), CellState(1, 3, Direction.NORTH),
+              CellState(4, 4, Direction.EAST), CellState(3, 4, Direction.EAST, screenshot_id=1),
+              CellState(2, 1, Direction.SOUTH), CellState(2, 2, Direction.SOUTH, screenshot_id=2)]
+    obstacles = [{"x": 3, "y": 8, "id": 1, "d": 4}, {"x": 2, "y": 6, "id": 2, "d": 0}]
+    commands = command_generator(states, obstacles)
+    for stream in (commands, [], ["SNAP7", "SNAP12_L", "SNAP3_R", "FIN"]):
+        encoded = encode_commands(stream)
+        assert render_commands(decode_commands(encoded)) == stream, stream
+        print(f"{len(stream)} commands: {len(encoded)} bytes binary, {len(json.dumps(stream))} bytes JSON")
+
+    # Values outside the unsigned fields are rejected instead of raising struct.error
+    for stream in (["SNAP-3_C"], [":1/MOTOR/FWD/50/70000;"], [":70000/MOTOR/FWD/50/10;"], [":1/MOTOR/REV/300/10;"]):
+        try:
+            encode_commands(stream)
+        except ValueError as e:
+            print(f"rejected: {e}")
+        else:
+            raise AssertionError(f"{stream} should not encode")
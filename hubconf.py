@@ -11,7 +11,8 @@ Usage:
 import torch
 
 
-def _create(name, pretrained=True, channels=3, classes=80, autoshape=True, verbose=True, device=None):
+def _create(name, pretrained=True, channels=3, classes=80, autoshape=True, verbose=True, device=None,
+            precision='auto', channels_last=False):
     """Creates or loads a YOLOv5 model
 
     Arguments:
@@ -22,6 +23,9 @@ def _create(name, pretrained=True, channels=3, classes=80, autoshape=True, verbo
         autoshape (bool): apply YOLOv5 .autoshape() wrapper to model
         verbose (bool): print all information to screen
         device (str, torch.device, None): device to use for model parameters
+        precision (str): 'auto', 'fp32', 'bf16' or 'fp16' inference precision of pretrained models,
+            'auto' is fp16 on CUDA and fp32 on CPU (see utils.torch_utils.select_precision)
+        channels_last (bool): run pretrained models with channels_last (NHWC) convolution weights and inputs
 
     Returns:
         YOLOv5 model
@@ -43,7 +47,7 @@ def _create(name, pretrained=True, channels=3, classes=80, autoshape=True, verbo
         device = select_device(('0' if torch.cuda.is_available() else 'cpu') if device is None else device)
         #device = 'mps'
         if pretrained and channels == 3 and classes == 80:
-            model = DetectMultiBackend(path, device=device)  # download/load FP32 model
+            model = DetectMultiBackend(path, device=device, precision=precision, channels_last=channels_last)
             # model = models.experimental.attempt_load(path, map_location=device)  # download/load FP32 model
         else:
             cfg = list((Path(__file__).parent / 'models').rglob(f'{path.stem}.yaml'))[0]  # model.yaml path
@@ -65,9 +69,10 @@ def _create(name, pretrained=True, channels=3, classes=80, autoshape=True, verbo
         raise Exception(s) from e
 
 
-def custom(path='path/to/model.pt', autoshape=True, verbose=True, device=None):
+def custom(path='path/to/model.pt', autoshape=True, verbose=True, device=None, precision='auto', channels_last=False):
     # YOLOv5 custom or local model
-    return _create(path, autoshape=autoshape, verbose=verbose, device=device)
+    return _create(path, autoshape=autoshape, verbose=verbose, device=device, precision=precision,
+                   channels_last=channels_last)
 
 
 def yolov5n(pretrained=True, channels=3, classes=80, autoshape=True, verbose=True, device=None):
@@ -1,9 +1,14 @@
-import time, os
-from algo.algo import MazeSolver
-from flask import Flask, request, jsonify, Response
+import time, os, json, signal, sys
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from model import load_model, predict_image, predict_image_week_9, stitch_image, stitch_image_own
-from helper import command_generator
+from model import ModelLoader, decode_image, predict_image, predict_image_week_9, stitch_image, stitch_image_own
+from helper import iter_command_records, optimize_commands, render_commands, encode_commands, COMMANDS_MIMETYPE
+from planner import build_maze_solver, build_path_results, command_max_distance, layout_key, solve_layout, solve_many, \
+    start_error, validate_layout, SingleFlight
+from telemetry import SolverMetrics
+from recorder import RequestRecorder
+from writer import BackgroundWriter
+from batcher import InferenceBatcher
 
 app = Flask(__name__)
 CORS(app)
@@ -341,123 +346,238 @@ drawGrid();
 """
     return Response(html, mimetype="text/html")
 
-# model = load_model()
-model = None
+# The model is loaded and warmed up in the background at boot; /status reports when it is ready. The debug
+# reloader's watcher process (python main.py without WERKZEUG_RUN_MAIN) never serves requests, so it skips it
+model_loader = ModelLoader()
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    model_loader.start()
+# Seconds /image waits for a model that is still loading
+MODEL_WAIT_TIMEOUT = 60
+
+# Set MDP_RECORD_DIR to record /path and /image requests for replay (bench/replay.py)
+recorder = RequestRecorder(os.environ['MDP_RECORD_DIR']) if os.environ.get('MDP_RECORD_DIR') else None
+
+# Uploads are decoded in memory; the raw files are only kept in uploads/ if MDP_SAVE_UPLOADS is set (default on)
+SAVE_UPLOADS = os.environ.get('MDP_SAVE_UPLOADS', '1').lower() not in ('0', 'false', 'no')
+# Writes uploads and result images in the background so /image never waits for the disk; flushed at exit
+artifact_writer = BackgroundWriter(name='artifact-writer')
+# Concurrent /image requests share batched forward passes: up to MDP_BATCH_SIZE images (1 disables batching),
+# the first one waiting at most MDP_BATCH_LATENCY_MS for the others
+inference_batcher = InferenceBatcher(max_batch=int(os.environ.get('MDP_BATCH_SIZE', '4')),
+                                     max_latency=float(os.environ.get('MDP_BATCH_LATENCY_MS', '5')) / 1000,
+                                     name='inference-batcher')
+
+
+def save_upload(filename, data):
+    os.makedirs('uploads', exist_ok=True)
+    with open(os.path.join('uploads', filename), 'wb') as f:
+        f.write(data)
 
 @app.route('/status', methods=['GET'])
 def status():
-    return jsonify({"result": "ok"})
+    """
+    Server is up; "model" tells whether /image is ready. The Pi polls until model.ready is true.
+    """
+    return jsonify({"result": "ok", "model": model_loader.status(), "writer": artifact_writer.stats(),
+                    "batcher": inference_batcher.stats()})
+
 
+# Identical /path requests in flight at the same time share a single solve
+path_flight = SingleFlight()
+# Aggregated solver stats served at /metrics
+solver_metrics = SolverMetrics()
 
-# Incoming direction encoding (team):
-#   1=NORTH, 2=EAST, 3=SOUTH, 4=WEST
-# MazeSolver encoding (your code/UI):
-#   0=NORTH, 2=EAST, 4=SOUTH, 6=WEST
-DIR_1234_TO_0246 = {1: 0, 2: 2, 3: 4, 4: 6}
 
-def map_dir_1234_to_0246(d, default=0):
+def solve_path(content):
     """
-    Accepts:
-      - team format: 1/2/3/4 -> map to 0/2/4/6
-      - already-correct: 0/2/4/6 -> keep
+    Solves a /path request body and returns the /path response body, with "timings" and "stats".
     """
-    try:
-        d = int(d)
-    except Exception:
-        return default
-    if d in (0, 2, 4, 6):
-        return d
-    return DIR_1234_TO_0246.get(d, default)
+    result = solve_layout(content)
+    print(f"Time taken to find shortest path using A* search: {result['timings']['solve']}s")
+    print(f"Distance to travel: {result['data']['distance']} units")
+
+    solver_metrics.observe(result['stats'], result['timings'])
+    return result
 
 
 @app.route('/path', methods=['POST'])
 def path_finding():
     content = request.get_json(silent=True) or {}
     print(content)
+    if recorder:
+        recorder.record_path(content)
 
-    obstacles = content.get('obstacles', [])
-    retrying = bool(content.get('retrying', False))
+    try:
+        validate_layout(content)
+        key = layout_key(content)
+    except ValueError as e:
+        return jsonify({"data": None, "error": str(e)}), 400
+    result = path_flight.do(key, lambda: solve_path(content))
+
+    # The Pi can ask for the compact binary command stream instead of JSON
+    if result["error"] is None and \
+            request.accept_mimetypes.best_match(['application/json', COMMANDS_MIMETYPE]) == COMMANDS_MIMETYPE:
+        try:
+            return Response(encode_commands(result["data"]["commands"]), mimetype=COMMANDS_MIMETYPE)
+        except ValueError as e:  # a value outside the binary format's fields, the JSON commands have no limits
+            return jsonify({"data": None, "error": str(e)}), 400
+
+    response = {"data": result["data"], "error": result["error"]}
+    # Solver stats are only returned when asked for
+    if content.get('stats'):
+        response["timings"] = result["timings"]
+        response["stats"] = result["stats"]
+    return jsonify(response)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Histograms of the solver stats and timings of every /path solve since start-up.
+    """
+    return jsonify(solver_metrics.to_dict())
 
-    robot_x = int(content.get('robot_x', 1))
-    robot_y = int(content.get('robot_y', 1))
-    robot_direction = map_dir_1234_to_0246(content.get('robot_dir', 1))  # default 1(N) -> 0
 
-    maze_solver = MazeSolver(20, 20, robot_x, robot_y, robot_direction, big_turn=None)
+def sse_event(event, data):
+    """Formats a single Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-    normalized_obstacles = []
-    for ob in obstacles:
-        x = int(ob.get('x', 0))
-        y = int(ob.get('y', 0))
-        oid = int(ob.get('id', 0))
-        d = map_dir_1234_to_0246(ob.get('d', 1))  # default 1(N)
 
-        maze_solver.add_obstacle(x, y, d, oid)
-        normalized_obstacles.append({"x": x, "y": y, "id": oid, "d": d})
+@app.route('/path/stream', methods=['POST'])
+def path_finding_stream():
+    """
+    Streaming variant of /path using Server-Sent Events.
 
-    start = time.time()
-    optimal_path, distance = maze_solver.get_optimal_order_dp(retrying=retrying)
-    print(f"Time taken to find shortest path using A* search: {time.time() - start}s")
-    print(f"Distance to travel: {distance} units")
+    Events:
+      - order: {"distance": d, "order": [obstacle ids]} once the solver has fixed the visit order
+      - leg:   {"leg": k, "commands": [...]}, one per obstacle visited; the last leg ends with STOP and FIN
+      - done:  {"distance": d, "path": [...]} once every leg has been sent
+      - error: {"error": msg} if the start position is invalid or the solver returns no path
 
-    if not optimal_path:
-        return jsonify({
-            "data": {"distance": 0, "path": [], "commands": []},
-            "error": "No path returned by solver"
-        })
+    An invalid body (cell_size, max_distance) is a 400 with {"error": msg} instead of a stream.
 
-    commands = command_generator(optimal_path, normalized_obstacles)
-
-    path_results = [optimal_path[0].get_dict()]
-    i = 0
-    for command in commands:
-        if command.startswith("SNAP") or command.startswith("FIN"):
-            continue
-        # Handle new motor protocol format: :[cmdId]/MOTOR/[command]/[param1]/[param2];
-        elif "/MOTOR/FWD/" in command or "/MOTOR/REV/" in command:
-            try:
-                # Extract distance from motor protocol command
-                parts = command.split("/")
-                distance = int(parts[-1].rstrip(";"))
-                i += distance // 10
-            except Exception:
-                pass
-        # Handle old format for backward compatibility
-        elif command.startswith(("FW", "FS", "BW", "BS")):
-            try:
-                i += int(command[2:]) // 10
-            except Exception:
-                pass
-        # Handle turn commands (both old and new format)
-        elif "/MOTOR/TURN" in command or command.startswith(("FR", "FL", "BR", "BL")):
-            i += 1
-        else:
-            i += 1
-
-        if 0 <= i < len(optimal_path):
-            path_results.append(optimal_path[i].get_dict())
-        else:
-            break
+    Concatenating the commands of every leg gives exactly the /path commands (same cmd IDs). Each leg is sent as
+    soon as the solver has stitched its segment (MazeSolver.iter_optimal_order_dp), but the order itself is only
+    fixed once the whole search is done, so the first event comes about as late as the /path response.
+    """
+    content = request.get_json(silent=True) or {}
+    print(content)
+    if recorder:
+        recorder.record_path(content, endpoint='/path/stream')
 
-    return jsonify({
-        "data": {
+    try:
+        maze_solver, normalized_obstacles, retrying = build_maze_solver(content)
+        max_distance = command_max_distance(content)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def generate():
+        error = start_error(maze_solver)
+        if error:
+            yield sse_event("error", {"error": error})
+            return
+
+        start = time.time()
+        events = maze_solver.iter_optimal_order_dp(retrying=retrying)
+        order = next(events, None)
+        print(f"Time taken to find shortest path using A* search: {time.time() - start}s")
+
+        if order is None:
+            yield sse_event("error", {"error": "No path returned by solver"})
+            return
+        _, distance, obstacle_order = order
+        yield sse_event("order", {"distance": distance, "order": obstacle_order})
+
+        optimal_path = []
+
+        def path_states():
+            # The states of each segment as the solver stitches it, kept for the done event
+            for _, segment in events:
+                optimal_path.extend(segment)
+                yield from segment
+
+        ranges = []
+        legs = iter_command_records(path_states(), normalized_obstacles, cell_size=maze_solver.grid.cell_size)
+        for leg_index, leg in enumerate(legs):
+            # Legs end on a SNAP, which optimize_commands never merges across, so legs can be optimised alone
+            if content.get('optimize'):
+                leg = optimize_commands(leg, max_distance)
+            ranges.extend(command.path_range for command in leg)
+            yield sse_event("leg", {"leg": leg_index, "commands": render_commands(leg)})
+
+        yield sse_event("done", {
             "distance": distance,
-            "path": path_results,
-            "commands": commands
-        },
-        "error": None
-    })
+            "duration": maze_solver.cost_model.estimate_duration(optimal_path, maze_solver.grid.scale),
+            "path": build_path_results(optimal_path, ranges)
+        })
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route('/path/batch', methods=['POST'])
+def path_finding_batch():
+    """
+    Solves many layouts in one call, fanned out across a process pool.
+
+    Body: {"layouts": [<'/path' body>, ...], "workers": n (optional)}
+
+    Response is NDJSON, one line per layout in completion order: the /path response plus
+    "index" (position in "layouts"), "timings" (seconds) and "stats". A malformed body is a 400 with
+    {"error": msg}, before any layout is solved.
+    """
+    content = request.get_json(silent=True) or {}
+    if not isinstance(content, dict):
+        return jsonify({"error": "body must be an object"}), 400
+    layouts = content.get('layouts', [])
+    workers = content.get('workers')
+    if not isinstance(layouts, list):
+        return jsonify({"error": "layouts must be a list of /path request bodies"}), 400
+    if workers is not None and (isinstance(workers, bool) or not isinstance(workers, int) or workers < 1):
+        return jsonify({"error": f"workers must be a positive integer, got {workers!r}"}), 400
+    for index, layout in enumerate(layouts):
+        try:
+            validate_layout(layout)
+        except ValueError as e:
+            return jsonify({"error": f"layouts[{index}]: {e}"}), 400
+
+    def generate():
+        for result in solve_many(layouts, workers=workers):
+            yield json.dumps(result) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
 
 @app.route('/image', methods=['POST'])
 def image_predict():
     file = request.files['file']
     filename = file.filename
-    file.save(os.path.join('uploads', filename))
+    data = file.read()
+    if recorder:
+        recorder.record_image(filename, data)
+    if SAVE_UPLOADS:
+        artifact_writer.submit(save_upload, filename, data)
 
     constituents = file.filename.split("_")
     obstacle_id = constituents[1]
 
-    image_id = predict_image_week_9(filename, model)
+    model = model_loader.get(timeout=MODEL_WAIT_TIMEOUT)
+    if model is None:
+        return jsonify({
+            "obstacle_id": obstacle_id,
+            "image_id": "NA",
+            "error": f"Model not ready ({model_loader.state})"
+        }), 503
+
+    try:
+        img = decode_image(data)
+    except ValueError as e:
+        return jsonify({"obstacle_id": obstacle_id, "image_id": "NA", "error": str(e)}), 400
+
+    try:
+        image_id = predict_image_week_9(img, model, filename, writer=artifact_writer, batcher=inference_batcher)
+    except ValueError as e:  # e.g. an input size a TorchScript export was not traced for
+        return jsonify({"obstacle_id": obstacle_id, "image_id": "NA", "error": str(e)}), 400
 
     return jsonify({
         "obstacle_id": obstacle_id,
@@ -467,6 +587,8 @@ def image_predict():
 
 @app.route('/stitch', methods=['GET'])
 def stitch():
+    # Result images of the last /image calls may still be queued
+    artifact_writer.flush()
     img = stitch_image()
     img.show()
     img2 = stitch_image_own()
@@ -475,4 +597,6 @@ def stitch():
 
 
 if __name__ == '__main__':
+    # Turn SIGTERM into a normal exit so the queued result images are flushed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     app.run(host='0.0.0.0', port=5000, debug=True)
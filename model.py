@@ -7,9 +7,11 @@ from PIL import Image
 import cv2
 import random
 import string
+import threading
 import numpy as np
 
 from consts import NAME_TO_ID
+from utils.torch_utils import configure_threads
 
 def get_random_string(length):
     """
@@ -27,14 +29,158 @@ def get_random_string(length):
     result_str = ''.join(random.choice(string.ascii_letters) for i in range(length))
     return result_str
 
-def load_model():
+# Size (width, height) of the images the Pi sends, used to warm the model up on the real input shape
+WARMUP_IMAGE_SIZE = tuple(int(v) for v in os.environ.get('MDP_IMAGE_SIZE', '640x480').split('x'))
+WARMUP_PASSES = 3
+# Inference precision: auto (fp16 on CUDA, fp32 on CPU), fp32, bf16 or fp16; int8 is a quantize.py export
+MODEL_PRECISION = os.environ.get('MDP_PRECISION', 'auto')
+# Weights to serve: the PyTorch checkpoint, or its TorchScript export (python export.py --weights Week_9.pt)
+MODEL_WEIGHTS = os.environ.get('MDP_WEIGHTS', 'Week_9.pt')
+# NHWC convolutions (off by default), and torch intra-op / inter-op threads (0 keeps torch's default)
+# bench/bench_threads.py finds the best values for a machine
+MODEL_CHANNELS_LAST = os.environ.get('MDP_CHANNELS_LAST', '0').lower() not in ('0', 'false', 'no')
+MODEL_THREADS = int(os.environ.get('MDP_TORCH_THREADS', '0'))
+MODEL_INTEROP_THREADS = int(os.environ.get('MDP_TORCH_INTEROP_THREADS', '0'))
+
+def load_model(precision=MODEL_PRECISION, weights=MODEL_WEIGHTS, channels_last=MODEL_CHANNELS_LAST,
+               threads=MODEL_THREADS, interop_threads=MODEL_INTEROP_THREADS):
     """
     Load the model from the local directory
+
+    Inputs
+    ------
+    precision: str - inference precision, see utils.torch_utils.select_precision
+
+    weights: str - .pt checkpoint or .torchscript export
+
+    channels_last: bool - run the convolutions on channels_last (NHWC) weights and inputs
+
+    threads: int - torch intra-op threads, 0 keeps the default (one per physical core)
+
+    interop_threads: int - torch inter-op threads, 0 keeps the default
     """
+    # Before any inference: inter-op threads cannot be changed once torch has used them
+    configure_threads(threads or None, interop_threads or None)
     #model = torch.hub.load('./', 'custom', path='YOLOv5_new.pt', source='local')
-    model = torch.hub.load('./', 'custom', path='Week_9.pt', source='local')
+    model = torch.hub.load('./', 'custom', path=weights, source='local', precision=precision,
+                           channels_last=channels_last)
     return model
 
+def warmup_model(model, image_size=WARMUP_IMAGE_SIZE, passes=WARMUP_PASSES):
+    """
+    Run a few inferences on a blank image so that the first real image does not pay for lazy initialisation
+    (allocator growth, cuDNN / TorchScript autotuning, letterbox shapes)
+
+    Inputs
+    ------
+    model: torch.hub.load - model to warm up
+
+    image_size: (int, int) - width and height of the images the model will see
+
+    passes: int - number of inferences to run
+
+    Returns
+    -------
+    float - time taken in seconds
+    """
+    start = time.perf_counter()
+    width, height = image_size
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    # Through AutoShape, so pre-processing and NMS run at the real shape too. DetectMultiBackend.warmup
+    # alone is skipped on CPU and only runs a 640x640 forward pass
+    for _ in range(passes):
+        model(image)
+    return time.perf_counter() - start
+
+class ModelLoader:
+    """
+    Loads and warms up the model in a background thread, so the server can take requests while it loads
+
+    state goes from 'idle' to 'loading', 'warming_up' and 'ready', or 'error' if loading fails
+    """
+    def __init__(self, loader=load_model, image_size=WARMUP_IMAGE_SIZE, passes=WARMUP_PASSES):
+        self.loader = loader
+        self.image_size = image_size
+        self.passes = passes
+        self.state = 'idle'
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.precision = None
+        self.channels_last = None
+        self.threads = None
+        self._model = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start loading in a daemon thread, does nothing if already started
+        """
+        if self._thread is None:
+            self.state = 'loading'
+            self._thread = threading.Thread(target=self._run, name='model-loader', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            start = time.perf_counter()
+            model = self.loader()
+            self.load_seconds = time.perf_counter() - start
+            # Precision chosen by DetectMultiBackend (see load_model)
+            self.precision = getattr(getattr(model, 'model', None), 'precision', None)
+            self.channels_last = getattr(getattr(model, 'model', None), 'channels_last', None)
+            self.threads = [torch.get_num_threads(), torch.get_num_interop_threads()]
+            self.state = 'warming_up'
+            self.warmup_seconds = warmup_model(model, self.image_size, self.passes)
+            self._model = model
+            self.state = 'ready'
+            print(f"Model loaded in {self.load_seconds:.2f}s, warmed up in {self.warmup_seconds:.2f}s")
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            self.state = 'error'
+            print(f"Model failed to load: {self.error}")
+        finally:
+            self._done.set()
+
+    @property
+    def ready(self):
+        return self.state == 'ready'
+
+    def status(self):
+        """
+        Returns
+        -------
+        dict - state, ready, load and warmup times in seconds, inference precision, memory format,
+        intra-op and inter-op threads, error message
+        """
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "precision": self.precision,
+            "channels_last": self.channels_last,
+            "threads": self.threads,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "error": self.error,
+        }
+
+    def get(self, timeout=None):
+        """
+        Wait for the model to be ready and return it
+
+        Inputs
+        ------
+        timeout: float - seconds to wait, None to wait until loading finishes
+
+        Returns
+        -------
+        the model, or None if it failed to load, was never started or is still loading after timeout
+        """
+        if self._thread is not None:
+            self._done.wait(timeout)
+        return self._model
+
 def draw_own_bbox(img,x1,y1,x2,y2,label,color=(36,255,12),text_color=(0,0,0)):
     """
     Draw bounding box on the image with text label and save both the raw and annotated image in the 'own_results' folder
@@ -79,7 +225,141 @@ def draw_own_bbox(img,x1,y1,x2,y2,label,color=(36,255,12),text_color=(0,0,0)):
     cv2.imwrite(f"own_results/annotated_image_{label}_{rand}.jpg", img)
 
 
-def predict_image(image, model, signal):
+def save_results(results, img, pred):
+    """
+    Save the evidence images of a prediction: the own annotated and raw images (if there is a prediction) and the
+    YOLO results in the 'runs' folder
+
+    Inputs
+    ------
+    results: Detections - model output
+
+    img: PIL.Image or numpy.ndarray - image the prediction was made on
+
+    pred: dict - chosen prediction (see as_prediction), or None
+
+    Returns
+    -------
+    None
+    """
+    # results.save draws its boxes on array images in place, so the raw image is saved first
+    if pred is not None:
+        draw_own_bbox(np.array(img), pred['xmin'], pred['ymin'], pred['xmax'], pred['ymax'], pred['name'])
+    results.save('runs')
+
+def submit_results(writer, results, img, pred):
+    """
+    Save the evidence images with writer (a writer.BackgroundWriter), or right away if writer is None
+    """
+    if writer is None:
+        save_results(results, img, pred)
+    else:
+        writer.submit(save_results, results, img, pred)
+
+# Columns of the rows returned by detections_by_area
+XMIN, YMIN, XMAX, YMAX, CONFIDENCE, CLASS, AREA = range(7)
+
+def detections_by_area(results):
+    """
+    Detections of the first image as a tensor, sorted by decreasing bounding box area, with Bullseye removed
+
+    Inputs
+    ------
+    results: Detections - model output
+
+    Returns
+    -------
+    torch.Tensor - (n, 7) float64 rows of xmin, ymin, xmax, ymax, confidence, class, area
+    """
+    # float64, so areas and thresholds are computed exactly like on the pandas float columns
+    pred = results.pred[0].double()
+    area = (pred[:, YMAX] - pred[:, YMIN]) * (pred[:, XMAX] - pred[:, XMIN])
+    names = results.names.items() if isinstance(results.names, dict) else enumerate(results.names)
+    bullseye = [c for c, name in names if name == 'Bullseye']
+    keep = ~torch.isin(pred[:, CLASS], torch.tensor(bullseye, dtype=pred.dtype, device=pred.device))
+    rows = torch.cat([pred, area[:, None]], 1)[keep]
+    return rows[torch.argsort(rows[:, AREA], descending=True, stable=True)]
+
+def as_prediction(row, names):
+    """
+    Converts a detections_by_area row to the dict used by draw_own_bbox and NAME_TO_ID
+    """
+    xmin, ymin, xmax, ymax, confidence, c, area = row
+    return {'xmin': xmin, 'ymin': ymin, 'xmax': xmax, 'ymax': ymax, 'confidence': confidence,
+            'class': int(c), 'name': names[int(c)], 'bboxArea': area}
+
+def select_prediction(results, signal):
+    """
+    Choose the symbol in the image: the only detection if there is one, otherwise the largest confident ones,
+    told apart by the signal (L: leftmost, R: rightmost, C: central or largest). Bullseye is ignored.
+
+    Inputs
+    ------
+    results: Detections - model output
+
+    signal: str - signal to be used for filtering the predictions
+
+    Returns
+    -------
+    dict - chosen prediction (see as_prediction), or None
+    """
+    rows = detections_by_area(results)
+
+    # Only 1 symbol detected, whatever its confidence
+    if len(rows) == 1:
+        return as_prediction(rows[0].tolist(), results.names)
+    if len(rows) == 0:
+        return None
+
+    # More than 1 Symbol detected, filter by confidence and area: walking down the areas, keep each prediction
+    # with an area of at least 80% of the last one kept (60% for 'One'). Only this scan is sequential
+    confident = rows[rows[:, CONFIDENCE] > 0.5].tolist()
+    pred_shortlist = []
+    current_area = rows[0, AREA].item()
+    for row in confident:
+        is_one = results.names[int(row[CLASS])] == 'One'
+        if current_area * 0.8 <= row[AREA] or (is_one and current_area * 0.6 <= row[AREA]):
+            pred_shortlist.append(row)
+            current_area = row[AREA]
+
+    if not pred_shortlist:
+        return None
+    # If only 1 prediction remains after filtering by confidence and area
+    if len(pred_shortlist) == 1:
+        return as_prediction(pred_shortlist[0], results.names)
+
+    # Use signal to filter further, from left to right in the image
+    pred_shortlist.sort(key=lambda row: row[XMIN])
+    if signal == 'L':
+        return as_prediction(pred_shortlist[0], results.names)
+    if signal == 'R':
+        return as_prediction(pred_shortlist[-1], results.names)
+    # If signal is 'C', choose the first prediction with its xmin between 250 and 774, i.e. the center of the image
+    for row in pred_shortlist:
+        if 250 < row[XMIN] < 774:
+            return as_prediction(row, results.names)
+    # Choosing one with largest area if none are central
+    return as_prediction(max(reversed(pred_shortlist), key=lambda row: row[AREA]), results.names)
+
+def select_prediction_week_9(results):
+    """
+    Choose the symbol in the image: the largest detection with confidence > 0.5 that is not Bullseye
+
+    Inputs
+    ------
+    results: Detections - model output
+
+    Returns
+    -------
+    dict - chosen prediction (see as_prediction), or None
+    """
+    rows = detections_by_area(results)
+    confident = torch.nonzero(rows[:, CONFIDENCE] > 0.5)
+    if len(confident) == 0:
+        return None
+    return as_prediction(rows[confident[0, 0]].tolist(), results.names)
+
+def predict_image(image, model, signal, writer=None, batcher=None):
     """
     Predict the image using the model and save the results in the 'runs' folder
     
@@ -91,6 +371,10 @@ def predict_image(image, model, signal):
 
     signal: str - signal to be used for filtering the predictions
 
+    writer: BackgroundWriter - writes the result images off the request path, None to write them before returning
+
+    batcher: InferenceBatcher - runs the image in a batch with those of concurrent requests, None to call the model
+
     Returns
     -------
     str - predicted label
@@ -100,90 +384,13 @@ def predict_image(image, model, signal):
         img = Image.open(os.path.join('uploads', image))
 
         # Predict the image using the model
-        results = model(img)
-
-        # Images with predicted bounding boxes are saved in the runs folder
-        results.save('runs')
-
-        # Convert the results to a pandas dataframe and calculate the height and width of the bounding box and the area of the bounding box
-        df_results = results.pandas().xyxy[0]
-        df_results['bboxHt'] = df_results['ymax'] - df_results['ymin']
-        df_results['bboxWt'] = df_results['xmax'] - df_results['xmin']
-        df_results['bboxArea'] = df_results['bboxHt'] * df_results['bboxWt']
-
-        # Label with largest bbox height will be last
-        df_results = df_results.sort_values('bboxArea', ascending=False)
-
-        # Filter out Bullseye
-        pred_list = df_results 
-        pred_list = pred_list[pred_list['name'] != 'Bullseye']
-        
-        # Initialize prediction to NA
-        pred = 'NA'
-
-        # Ignore Bullseye unless they are the only image detected and select the last label in the list (the last label will be the one with the largest bbox height)
-        if len(pred_list) == 1:
-            if pred_list.iloc[0]['name'] != 'Bullseye':
-                pred = pred_list.iloc[0]
-
-        # If more than 1 label is detected
-        elif len(pred_list) > 1:
-
-            # More than 1 Symbol detected, filter by confidence and area
-            pred_shortlist = []
-            current_area = pred_list.iloc[0]['bboxArea']
-            # For each prediction, check if the confidence is greater than 0.5 and if the area is greater than 80% of the current area or 60% if the prediction is 'One'
-            for _, row in pred_list.iterrows():
-                if row['name'] != 'Bullseye' and row['confidence'] > 0.5 and ((current_area * 0.8 <= row['bboxArea']) or (row['name'] == 'One' and current_area * 0.6 <= row['bboxArea'])):
-                    # Add the prediction to the shortlist
-                    pred_shortlist.append(row)
-                    # Update the current area to the area of the prediction
-                    current_area = row['bboxArea']
-            
-            # If only 1 prediction remains after filtering by confidence and area
-            if len(pred_shortlist) == 1:
-                # Choose that prediction
-                pred = pred_shortlist[0]
-
-            # If multiple predictions remain after filtering by confidence and area
-            else:
-                # Use signal of {signal} to filter further 
-                
-                # Sort the predictions by xmin
-                pred_shortlist.sort(key=lambda x: x['xmin'])
-
-                # If signal is 'L', choose the first prediction in the list, i.e. leftmost in the image
-                if signal == 'L':
-                    pred = pred_shortlist[0]
-                
-                # If signal is 'R', choose the last prediction in the list, i.e. rightmost in the image
-                elif signal == 'R':
-                    pred = pred_shortlist[-1]
-                
-                # If signal is 'C', choose the prediction that is central in the image
-                else:
-                    # Loop through the predictions shortlist
-                    for i in range(len(pred_shortlist)):
-                        # If the xmin of the prediction is between 250 and 774, i.e. the center of the image, choose that prediction
-                        if pred_shortlist[i]['xmin'] > 250 and pred_shortlist[i]['xmin'] < 774:
-                            pred = pred_shortlist[i]
-                            break
-                    
-                    # If no prediction is central, choose the one with the largest area
-                    if isinstance(pred,str):
-                        # Choosing one with largest area if none are central
-                        pred_shortlist.sort(key=lambda x: x['bboxArea']) 
-                        pred = pred_shortlist[-1]
-        
-        # Draw the bounding box on the image
-        if not isinstance(pred,str):
-            draw_own_bbox(np.array(img), pred['xmin'], pred['ymin'], pred['xmax'], pred['ymax'], pred['name'])
-
-        # If pred is not a string, i.e. a prediction was made and pred is not 'NA'
-        if not isinstance(pred,str):
-            image_id = str(NAME_TO_ID[pred['name']])
-        else:
-            image_id = 'NA'
+        results = batcher.predict(model, img) if batcher is not None else model(img)
+        pred = select_prediction(results, signal)
+
+        # Images with predicted bounding boxes are saved in the runs folder, and the own bounding box is drawn
+        submit_results(writer, results, img, pred)
+
+        image_id = str(NAME_TO_ID[pred['name']]) if pred is not None else 'NA'
         print(f"Final result: {image_id}")
         return image_id
     # If some error happened, we just return 'NA' so that the inference loop is closed
@@ -191,42 +398,43 @@ def predict_image(image, model, signal):
         print(f"Final result: NA")
         return 'NA'
 
-def predict_image_week_9(image, model):
-    # Load the image
-    img = Image.open(os.path.join('uploads', image))
-    # Run inference
-    results = model(img)
-    # Save the results
-    results.save('runs')
-    # Convert the results to a dataframe
-    df_results = results.pandas().xyxy[0]
-    # Calculate the height and width of the bounding box and the area of the bounding box
-    df_results['bboxHt'] = df_results['ymax'] - df_results['ymin']
-    df_results['bboxWt'] = df_results['xmax'] - df_results['xmin']
-    df_results['bboxArea'] = df_results['bboxHt'] * df_results['bboxWt']
-
-    # Label with largest bbox height will be last
-    df_results = df_results.sort_values('bboxArea', ascending=False)
-    pred_list = df_results 
-    pred = 'NA'
-    # If prediction list is not empty
-    if pred_list.size != 0:
-        # Go through the predictions, and choose the first one with confidence > 0.5
-        for _, row in pred_list.iterrows():
-            if row['name'] != 'Bullseye' and row['confidence'] > 0.5:
-                pred = row    
-                break
-
-        # Draw the bounding box on the image 
-        if not isinstance(pred,str):
-            draw_own_bbox(np.array(img), pred['xmin'], pred['ymin'], pred['xmax'], pred['ymax'], pred['name'])
-        
-    # Return the image id
-    if not isinstance(pred,str):
-        image_id = str(NAME_TO_ID[pred['name']])
+def decode_image(data):
+    """
+    Decode an uploaded image in memory, without going through the disk
+
+    Inputs
+    ------
+    data: bytes - encoded image (JPEG, PNG, ...)
+
+    Returns
+    -------
+    numpy.ndarray - RGB image (HWC, uint8), EXIF orientation applied
+    """
+    # np.frombuffer is a view on the request bytes, nothing is copied before decoding
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image")
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+def predict_image_week_9(image, model, filename=None, writer=None, batcher=None):
+    # Load the image, unless it was already decoded from the upload (see decode_image)
+    if isinstance(image, str):
+        filename = filename or image
+        img = Image.open(os.path.join('uploads', image))
     else:
-        image_id = 'NA'
-    return image_id
+        img = image
+    # Run inference, batched with the images of concurrent requests if batcher is given
+    results = batcher.predict(model, img) if batcher is not None else model(img)
+    if filename is not None:
+        # Arrays have no file name; name the saved result after the upload like images opened from disk
+        results.files = [os.path.splitext(os.path.basename(filename))[0] + '.jpg']
+    pred = select_prediction_week_9(results)
+
+    # Save the results and draw the bounding box on the image, in the background if writer is given
+    submit_results(writer, results, img, pred)
+
+    # Return the image id
+    return str(NAME_TO_ID[pred['name']]) if pred is not None else 'NA'
 
 
 def stitch_image():
@@ -3,7 +3,9 @@
 Common modules
 """
 
+import json
 import math
+import threading
 import warnings
 from copy import copy
 from pathlib import Path
@@ -20,11 +22,12 @@ from PIL import Image
 from torch.cuda import amp
 
 from utils import TryExcept
-from utils.dataloaders import exif_transpose, letterbox
+from utils.augmentations import letterbox_into
+from utils.dataloaders import exif_transpose
 from utils.general import (LOGGER, ROOT, Profile, colorstr,
                            increment_path, is_notebook, make_divisible, non_max_suppression, scale_boxes, xyxy2xywh, yaml_load)
 from utils.plots import Annotator, colors, save_one_box
-from utils.torch_utils import copy_attr, smart_inference_mode
+from utils.torch_utils import apply_precision, copy_attr, select_precision, smart_inference_mode, to_channels_last
 
 
 def autopad(k, p=None, d=1):  # kernel, padding, dilation
@@ -52,6 +55,10 @@ class Conv(nn.Module):
     def forward_fuse(self, x):
         return self.act(self.conv(x))
 
+    def forward_quant(self, x):
+        # int8 convolution between the quant/dequant stubs added by quantize.py, activation in float
+        return self.act(self.dequant(self.conv(self.quant(x))))
+
 
 class DWConv(Conv):
     # Depth-wise convolution
@@ -308,23 +315,51 @@ class Concat(nn.Module):
 
 class DetectMultiBackend(nn.Module):
     # YOLOv5 MultiBackend class for python inference on various backends
-    def __init__(self, weights='yolov5s.pt', device=torch.device('cpu'), dnn=False, data=None, fp16=False, fuse=True):
+    def __init__(self, weights='yolov5s.pt', device=torch.device('cpu'), dnn=False, data=None, fp16=False, fuse=True,
+                 precision='auto', channels_last=False):
         # Usage:
         #   PyTorch:              weights = *.pt
+        #   TorchScript:                    *.torchscript (see export.py)
+        # precision: 'auto', 'fp32', 'bf16' or 'fp16', see select_precision(); fp16=True means 'fp16'
+        # channels_last: NHWC convolution weights (PyTorch) and inputs (all formats)
         from models.experimental import attempt_load  # scoped to avoid circular import
 
         super().__init__()
         w = str(weights[0] if isinstance(weights, list) else weights)
-        pt = self._model_type(w)[0]
-        fp16 = True  # FP16
+        pt, jit, triton = self._model_type(w)
+        precision = 'fp16' if fp16 and precision == 'auto' else precision
         nhwc = False  # BHWC formats (vs torch BCWH)
         stride = 32  # default stride
+        export_shape = None  # BCHW input shape TorchScript models were traced at
         cuda = torch.cuda.is_available() and device.type != 'cpu'  # use CUDA
-        model = attempt_load(weights if isinstance(weights, list) else w, device=device, inplace=True, fuse=fuse)
-        stride = max(int(model.stride.max()), 32)  # model stride
-        names = model.module.names if hasattr(model, 'module') else model.names  # get class names
-        model.half() if fp16 else model.float()
-        self.model = model  # explicitly assign for to(), cpu(), cuda(), half()
+        if pt:  # PyTorch
+            precision = select_precision(device, precision)
+            model = attempt_load(weights if isinstance(weights, list) else w, device=device, inplace=True, fuse=fuse)
+            stride = max(int(model.stride.max()), 32)  # model stride
+            names = model.module.names if hasattr(model, 'module') else model.names  # get class names
+            model, dtype = apply_precision(model, precision)  # dtype of the inputs
+            if channels_last:
+                to_channels_last(model)
+            self.model = model  # explicitly assign for to(), cpu(), cuda(), half()
+        elif jit:  # TorchScript
+            LOGGER.info(f'Loading {w} for TorchScript inference...')
+            extra_files = {'config.txt': ''}  # model metadata
+            model = torch.jit.load(w, _extra_files=extra_files, map_location=device)
+            d = json.loads(extra_files['config.txt'],
+                           object_hook=lambda d: {int(k) if k.isdigit() else k: v for k, v in d.items()})
+            stride, names, export_shape = int(d['stride']), d['names'], tuple(d['shape'])
+            if 'engine' in d:  # int8 model, see quantize.py
+                torch.backends.quantized.engine = d['engine']
+            # Weights are frozen in the precision of the export
+            if precision not in ('auto', d['precision']):
+                LOGGER.warning(f"WARNING ⚠️ {w} was exported in {d['precision']}, ignoring precision={precision}")
+            precision, dtype = d['precision'], torch.float32
+            if d.get('optimize') and device.type == 'cpu':
+                model = torch.jit.optimize_for_inference(model)  # oneDNN convolutions, fused ops
+            self.model = model
+        else:
+            raise NotImplementedError(f'ERROR: {w} is not a supported format')
+        fp16 = precision == 'fp16'  # FP16
 
         # class names
         if 'names' not in locals():
@@ -337,14 +372,24 @@ class DetectMultiBackend(nn.Module):
     def forward(self, im, augment=False, visualize=False):
         # YOLOv5 MultiBackend inference
         b, ch, h, w = im.shape  # batch, channel, height, width
-        if self.fp16 and im.dtype != torch.float16:
-            im = im.half()  # to FP16
+        if im.dtype != self.dtype:
+            im = im.to(self.dtype)  # to FP16/BF16/FP32
+        if self.channels_last:
+            im = im.contiguous(memory_format=torch.channels_last)  # BCHW shape, BHWC memory
         if self.nhwc:
             im = im.permute(0, 2, 3, 1)  # torch BCHW to numpy BHWC shape(1,320,192,3)
 
         if self.pt:  # PyTorch
             y = self.model(im, augment=augment, visualize=visualize) if augment or visualize else self.model(im)
-        
+        elif self.jit:  # TorchScript
+            if tuple(im.shape[2:]) != self.export_shape[2:]:
+                raise ValueError(f'{self.w} was exported for {self.export_shape[2:]} inputs, got '
+                                 f'{tuple(im.shape[2:])}; export it again with --imgsz {im.shape[2]} {im.shape[3]}')
+            y = self.model(im)
+        if self.dtype == torch.bfloat16:  # NMS and box scaling in FP32
+            y = [x.float() if isinstance(x, torch.Tensor) else x for x in y] if isinstance(y, (list, tuple)) \
+                else y.float()
+
         if isinstance(y, (list, tuple)):
             return self.from_numpy(y[0]) if len(y) == 1 else [self.from_numpy(x) for x in y]
         else:
@@ -355,9 +400,10 @@ class DetectMultiBackend(nn.Module):
 
     def warmup(self, imgsz=(1, 3, 640, 640)):
         # Warmup model by running inference once
-        warmup_types = self.pt, self.jit, self.onnx, self.engine, self.saved_model, self.pb, self.triton
+        warmup_types = self.pt, self.jit, self.triton
         if any(warmup_types) and (self.device.type != 'cpu' or self.triton):
-            im = torch.empty(*imgsz, dtype=torch.half if self.fp16 else torch.float, device=self.device)  # input
+            imgsz = self.export_shape or imgsz  # TorchScript only runs its export shape
+            im = torch.empty(*imgsz, dtype=self.dtype, device=self.device)  # input
             for _ in range(2 if self.jit else 1):  #
                 self.forward(im)  # warmup
 
@@ -365,7 +411,7 @@ class DetectMultiBackend(nn.Module):
     def _model_type(p='path/to/model.pt'):
 
         def export_formats():
-            x = [['PyTorch', '-', '.pt', True, True],]
+            x = [['PyTorch', '-', '.pt', True, True], ['TorchScript', 'torchscript', '.torchscript', True, True]]
             return pd.DataFrame(x, columns=['Format', 'Argument', 'Suffix', 'CPU', 'GPU'])
 
         sf = list(export_formats().Suffix)  # export suffixes
@@ -383,6 +429,31 @@ class DetectMultiBackend(nn.Module):
         return None, None
 
 
+class InputBuffers:
+    # Pool of AutoShape input buffers, reused across calls of the same (batch, height, width, device, dtype, format):
+    # a uint8 BHWC tensor that images are letterboxed into (pinned on CUDA for async copies) and the BCHW model input.
+    # A buffer serves one call at a time, so concurrent calls never share one
+    def __init__(self, max_free=2):
+        self.max_free = max_free  # idle buffers kept per key
+        self.free = {}  # key: [(key, hwc, x), ...]
+        self.lock = threading.Lock()
+
+    def acquire(self, key):
+        with self.lock:
+            if self.free.get(key):
+                return self.free[key].pop()
+        n, h, w, device, dtype, memory_format = key
+        hwc = torch.empty((n, h, w, 3), dtype=torch.uint8, pin_memory=device.type == 'cuda')
+        x = torch.empty((n, 3, h, w), dtype=dtype, device=device, memory_format=memory_format)
+        return key, hwc, x
+
+    def release(self, buffers):
+        with self.lock:
+            free = self.free.setdefault(buffers[0], [])
+            if len(free) < self.max_free:
+                free.append(buffers)
+
+
 class AutoShape(nn.Module):
     # YOLOv5 input-robust model wrapper for passing cv2/np/PIL/torch inputs. Includes preprocessing, inference and NMS
     conf = 0.25  # NMS confidence threshold
@@ -401,6 +472,7 @@ class AutoShape(nn.Module):
         self.dmb = isinstance(model, DetectMultiBackend)  # DetectMultiBackend() instance
         self.pt = not self.dmb or model.pt  # PyTorch model
         self.model = model.eval()
+        self.input_buffers = InputBuffers()  # preallocated pre-processing outputs
         if self.pt:
             m = self.model.model.model[-1] if self.dmb else self.model.model[-1]  # Detect()
             m.inplace = False  # Detect.inplace=False for safe multithread inference
@@ -458,28 +530,38 @@ class AutoShape(nn.Module):
                 shape1.append([int(y * g) for y in s])
                 ims[i] = im if im.data.contiguous else np.ascontiguousarray(im)  # update
             shape1 = [make_divisible(x, self.stride) for x in np.array(shape1).max(0)]  # inf shape
-            x = [letterbox(im, shape1, auto=False)[0] for im in ims]  # pad
-            x = np.ascontiguousarray(np.array(x).transpose((0, 3, 1, 2)))  # stack and BHWC to BCHW
-            x = torch.from_numpy(x).to(p.device).type_as(p) / 255  # uint8 to fp16/32
-
-        with amp.autocast(autocast):
-            # Inference
-            with dt[1]:
-                y = self.model(x, augment=augment)  # forward
-
-            # Post-process
-            with dt[2]:
-                y = non_max_suppression(y if self.dmb else y[0],
-                                        self.conf,
-                                        self.iou,
-                                        self.classes,
-                                        self.agnostic,
-                                        self.multi_label,
-                                        max_det=self.max_det)  # NMS
-                for i in range(n):
-                    scale_boxes(shape1, y[i][:, :4], shape0[i])
-
-            return Detections(ims, y, files, dt, self.names, x.shape)
+            if self.dmb and self.model.export_shape:  # TorchScript only runs the shape it was traced at
+                shape1 = list(self.model.export_shape[2:])
+            # BHWC memory is what a channels_last model reads, so the conversion below is a plain copy for it
+            memory_format = torch.channels_last if getattr(self.model, 'channels_last', False) else \
+                torch.contiguous_format
+            buffers = self.input_buffers.acquire((n, *shape1, p.device, p.dtype, memory_format))
+            _, hwc, x = buffers
+            for i, im in enumerate(hwc.numpy()):
+                letterbox_into(ims[i], im)  # pad
+            x.copy_(hwc.permute(0, 3, 1, 2), non_blocking=True).div_(255)  # BHWC uint8 to BCHW fp16/32
+
+        try:
+            with amp.autocast(autocast):
+                # Inference
+                with dt[1]:
+                    y = self.model(x, augment=augment)  # forward
+
+                # Post-process
+                with dt[2]:
+                    y = non_max_suppression(y if self.dmb else y[0],
+                                            self.conf,
+                                            self.iou,
+                                            self.classes,
+                                            self.agnostic,
+                                            self.multi_label,
+                                            max_det=self.max_det)  # NMS
+                    for i in range(n):
+                        scale_boxes(shape1, y[i][:, :4], shape0[i])
+
+                return Detections(ims, y, files, dt, self.names, x.shape)
+        finally:
+            self.input_buffers.release(buffers)  # after NMS, which waits for any async copy out of hwc
 
 
 class Detections:
@@ -0,0 +1,327 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from algo.algo import MazeSolver
+from algo.cost_model import CostModel, TimeCostModel
+from consts import WIDTH, HEIGHT, CELL_SIZE
+from helper import iter_command_records, optimize_commands, render_commands, scale_cell, MAX_OPTIMIZED_DISTANCE
+
+
+# Set MDP_CALIBRATION to a calibration file (see calibration.example.json) to plan for the shortest run time
+# and report its predicted duration; otherwise the planner uses its abstract costs
+COST_MODEL = TimeCostModel.from_file(os.environ['MDP_CALIBRATION']) if os.environ.get('MDP_CALIBRATION') \
+    else CostModel()
+
+# Incoming direction encoding (team):
+#   1=NORTH, 2=EAST, 3=SOUTH, 4=WEST
+# MazeSolver encoding (your code/UI):
+#   0=NORTH, 2=EAST, 4=SOUTH, 6=WEST
+DIR_1234_TO_0246 = {1: 0, 2: 2, 3: 4, 4: 6}
+
+def map_dir_1234_to_0246(d, default=0):
+    """
+    Accepts:
+      - team format: 1/2/3/4 -> map to 0/2/4/6
+      - already-correct: 0/2/4/6 -> keep
+    """
+    try:
+        d = int(d)
+    except Exception:
+        return default
+    if d in (0, 2, 4, 6):
+        return d
+    return DIR_1234_TO_0246.get(d, default)
+
+
+def arena_config(content: dict) -> tuple:
+    """
+    Planning grid of a /path request body: 'cell_size' in cm (default CELL_SIZE, must divide it) and the arena
+    'width'/'height' in cells (default: the WIDTH x HEIGHT arena at that cell size). Positions in the body are in
+    cells of that grid.
+
+    Returns:
+        (size_x, size_y, cell_size)
+
+    Raises:
+        ValueError: if cell_size is not a positive divisor of CELL_SIZE
+    """
+    cell_size = int(content.get('cell_size', CELL_SIZE))
+    if cell_size <= 0 or CELL_SIZE % cell_size:
+        raise ValueError(f"cell_size must be a positive divisor of {CELL_SIZE}, got {cell_size}")
+    size_x = int(content.get('width', WIDTH * CELL_SIZE // cell_size))
+    size_y = int(content.get('height', HEIGHT * CELL_SIZE // cell_size))
+    return size_x, size_y, cell_size
+
+
+def robot_start(content: dict, cell_size: int) -> tuple:
+    """
+    Robot start of a /path request body, in cells of cell_size. The default is the (1, 1) cell of the CELL_SIZE
+    grid (helper.scale_cell), i.e. the same spot in the start zone at any cell size.
+
+    Returns:
+        (robot_x, robot_y, robot_direction)
+    """
+    default = scale_cell(1, cell_size)
+    return (int(content.get('robot_x', default)), int(content.get('robot_y', default)),
+            map_dir_1234_to_0246(content.get('robot_dir', 1)))  # default 1(N) -> 0
+
+
+def command_max_distance(content: dict) -> int:
+    """
+    Longest merged straight move of a /path request body with 'optimize' set: 'max_distance' in cm, or
+    MAX_OPTIMIZED_DISTANCE if missing or null.
+
+    Raises:
+        ValueError: if max_distance is not a positive integer
+    """
+    value = content.get('max_distance')
+    if value is None:
+        return MAX_OPTIMIZED_DISTANCE
+    try:
+        max_distance = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"max_distance must be an integer, got {value!r}") from None
+    if max_distance <= 0:
+        raise ValueError(f"max_distance must be positive, got {max_distance}")
+    return max_distance
+
+
+def start_error(maze_solver) -> str:
+    """Error message if the robot starts off the grid or too close to an obstacle, None if the start is valid"""
+    start = maze_solver.robot.get_start_state()
+    if maze_solver.grid.reachable(start.x, start.y):
+        return None
+    return f"Invalid start position ({start.x}, {start.y}): off the grid or too close to an obstacle"
+
+
+def build_maze_solver(content):
+    """
+    Builds a MazeSolver from a /path request body.
+
+    Returns:
+        (MazeSolver, normalized obstacles, retrying)
+    """
+    obstacles = content.get('obstacles', [])
+    retrying = bool(content.get('retrying', False))
+    size_x, size_y, cell_size = arena_config(content)
+    robot_x, robot_y, robot_direction = robot_start(content, cell_size)
+
+    maze_solver = MazeSolver(size_x, size_y, robot_x, robot_y, robot_direction, big_turn=None, cost_model=COST_MODEL,
+                             cell_size=cell_size)
+
+    normalized_obstacles = []
+    for ob in obstacles:
+        x = int(ob.get('x', 0))
+        y = int(ob.get('y', 0))
+        oid = int(ob.get('id', 0))
+        d = map_dir_1234_to_0246(ob.get('d', 1))  # default 1(N)
+
+        maze_solver.add_obstacle(x, y, d, oid)
+        normalized_obstacles.append({"x": x, "y": y, "id": oid, "d": d})
+
+    return maze_solver, normalized_obstacles, retrying
+
+
+def layout_key(content: dict) -> str:
+    """Canonical key of a /path request body; bodies that describe the same layout get the same key.
+
+    Args:
+        content: /path request body
+
+    Returns:
+        str: JSON string of the normalised layout
+
+    Raises:
+        ValueError: if the arena or max_distance of the body is invalid
+    """
+    arena = arena_config(content)
+    obstacles = [
+        (int(ob.get('x', 0)), int(ob.get('y', 0)), int(ob.get('id', 0)), map_dir_1234_to_0246(ob.get('d', 1)))
+        for ob in content.get('obstacles', [])
+    ]
+    return json.dumps({
+        "obstacles": obstacles,
+        "robot": robot_start(content, arena[2]),
+        "retrying": bool(content.get('retrying', False)),
+        "optimize": bool(content.get('optimize', False)),
+        "max_distance": command_max_distance(content),
+        "arena": arena,
+    })
+
+
+def validate_layout(content) -> None:
+    """Checks that content is a /path request body the solver can parse
+
+    Raises:
+        ValueError: describing the first problem found
+    """
+    if not isinstance(content, dict):
+        raise ValueError(f"a layout must be an object, got {type(content).__name__}")
+    obstacles = content.get('obstacles', [])
+    if not isinstance(obstacles, list) or not all(isinstance(ob, dict) for ob in obstacles):
+        raise ValueError("obstacles must be a list of objects")
+    try:
+        layout_key(content)  # parses every field the solver reads
+    except TypeError as e:
+        raise ValueError(str(e)) from None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the function, the others
+    wait for it and get the same result (or exception). Nothing is cached once the call finishes.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = dict()
+
+    def do(self, key, fn):
+        """Runs fn() unless a call with the same key is already in flight, in which case waits for its result
+
+        Args:
+            key: Hashable key identifying the call
+            fn: Zero-argument callable to run
+
+        Returns:
+            The result of fn()
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return result
+
+
+def build_path_results(optimal_path, ranges):
+    """
+    Maps the generated commands back onto the states of optimal_path: the start state, then the state each
+    movement command ends on.
+
+    Args:
+        optimal_path: List of CellStates returned by the solver
+        ranges: Path ranges of the commands, from command_generator(..., return_ranges=True)
+    """
+    path_results = [optimal_path[0].get_dict()]
+    for path_range in ranges:
+        if path_range is not None:
+            path_results.append(optimal_path[path_range[1]].get_dict())
+    return path_results
+
+
+def solve_layout(content: dict) -> dict:
+    """Solves a single /path request body and returns the /path response, plus timings and solver stats.
+
+    Args:
+        content: /path request body
+
+    Returns:
+        dict: {"data": {distance, path, commands}, "error", "timings", "stats"}
+    """
+    start = time.perf_counter()
+    maze_solver, normalized_obstacles, retrying = build_maze_solver(content)
+    max_distance = command_max_distance(content)
+    error = start_error(maze_solver)
+    if error:
+        return {
+            "data": {"distance": 0, "path": [], "commands": []},
+            "error": error,
+            "timings": {"solve": 0.0, "commands": 0.0, "total": time.perf_counter() - start},
+            "stats": dict(maze_solver.stats, obstacles=len(normalized_obstacles), astar_pairs=0, path_states=0),
+        }
+
+    solve_start = time.perf_counter()
+    optimal_path, distance = maze_solver.get_optimal_order_dp(retrying=retrying)
+    solve_time = time.perf_counter() - solve_start
+
+    stats = dict(
+        maze_solver.stats,
+        obstacles=len(normalized_obstacles),
+        astar_pairs=len(maze_solver.path_table) // 2,
+        path_states=len(optimal_path),
+    )
+
+    if not optimal_path:
+        return {
+            "data": {"distance": 0, "path": [], "commands": []},
+            "error": "No path returned by solver",
+            "timings": {"solve": solve_time, "commands": 0.0, "total": time.perf_counter() - start},
+            "stats": stats,
+        }
+
+    commands_start = time.perf_counter()
+    cell_size = maze_solver.grid.cell_size
+    records = [command for leg in iter_command_records(optimal_path, normalized_obstacles, cell_size=cell_size)
+               for command in leg]
+    stats["commands"] = len(records)
+    if content.get('optimize'):
+        records = optimize_commands(records, max_distance)
+        stats["commands_saved"] = stats["commands"] - len(records)
+        stats["commands"] = len(records)
+    commands = render_commands(records)
+    path_results = build_path_results(optimal_path, [command.path_range for command in records])
+    commands_time = time.perf_counter() - commands_start
+
+    return {
+        "data": {
+            "distance": distance,
+            "duration": maze_solver.cost_model.estimate_duration(optimal_path, maze_solver.grid.scale),
+            "path": path_results,
+            "commands": commands
+        },
+        "error": None,
+        "timings": {"solve": solve_time, "commands": commands_time, "total": time.perf_counter() - start},
+        "stats": stats,
+    }
+
+
+def _solve_indexed(index: int, content: dict) -> dict:
+    """Process pool entry point: solve_layout tagged with the layout's index, errors reported per layout"""
+    try:
+        result = solve_layout(content)
+    except Exception as e:
+        result = {"data": None, "error": f"{type(e).__name__}: {e}", "timings": None, "stats": None}
+    result["index"] = index
+    return result
+
+
+def solve_many(layouts: list, workers: int = None):
+    """Solves many /path request bodies across a process pool.
+
+    Args:
+        layouts: List of /path request bodies
+        workers: Number of worker processes. If None, uses os.cpu_count()
+
+    Yields:
+        dict: solve_layout result with an extra "index" key (position in `layouts`), in completion order
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    # Solving in-process avoids the pool start-up cost when there is nothing to fan out
+    if workers <= 1 or len(layouts) <= 1:
+        for index, content in enumerate(layouts):
+            yield _solve_indexed(index, content)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(layouts))) as executor:
+        futures = [executor.submit(_solve_indexed, index, content) for index, content in enumerate(layouts)]
+        for future in as_completed(futures):
+            yield future.result()
@@ -0,0 +1,177 @@
+# YOLOv5 🚀 by Ultralytics, GPL-3.0 license
+"""
+Quantize a YOLOv5 PyTorch model to int8 for CPU inference, behind an accuracy gate
+
+Post-training static quantization: every Conv block (models/common.py) runs its convolution in int8 between a
+quantize and a dequantize stub, with scales calibrated on a folder of Pi captures. Activations, Concat, Upsample and
+the Detect head stay in float. The result is saved as TorchScript (see export.py), because pickled quantized modules
+cannot be loaded back. load_model serves it with MDP_WEIGHTS.
+
+Before saving, both models are evaluated with utils.metrics.ap_per_class on a validation folder. The reference boxes
+are YOLO labels (images/x.jpg + labels/x.txt) where they exist, otherwise the confident detections of the fp32 model.
+The int8 model is only saved if its mAP@0.5 is at most --max-drop below the fp32 one; otherwise the exit status is 1.
+
+Usage:
+    $ python quantize.py --weights Week_9.pt --calib uploads --val datasets/val/images --imgsz 480 640
+    $ MDP_WEIGHTS=Week_9_int8.torchscript python main.py
+"""
+
+import argparse
+import copy
+import glob
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.ao.quantization import DeQuantStub, QuantStub, convert, get_default_qconfig, prepare
+
+from export import export_torchscript
+from models.common import AutoShape, Conv
+from models.experimental import attempt_load
+from utils.dataloaders import img2label_paths
+from utils.general import LOGGER, colorstr, xywhn2xyxy
+from utils.metrics import ap_per_class, box_iou
+from utils.torch_utils import smart_inference_mode
+
+IMG_FORMATS = '.jpg', '.jpeg', '.png', '.bmp'
+
+
+def load_images(folder, n=None):
+    # Returns the paths and RGB arrays of the first n images of folder
+    paths = sorted(p for p in glob.glob(os.path.join(folder, '*')) if p.lower().endswith(IMG_FORMATS))[:n]
+    assert paths, f'No images found in {folder}'
+    return paths, [np.asarray(Image.open(p).convert('RGB')) for p in paths]
+
+
+def quantize_static(model, images, engine):
+    # Returns an int8 copy of the fused model, its Conv blocks calibrated on images (RGB arrays)
+    torch.backends.quantized.engine = engine
+    model = copy.deepcopy(model).float().eval()
+    qconfig = get_default_qconfig(engine)
+    for m in model.modules():
+        if isinstance(m, Conv):
+            assert not hasattr(m, 'bn'), 'fuse the model before quantizing it'
+            m.quant, m.dequant = QuantStub(), DeQuantStub()
+            m.forward = m.forward_quant
+            m.qconfig = qconfig
+    prepare(model, inplace=True)
+    calibrator = AutoShape(model, verbose=False)  # same letterboxing as the server
+    with torch.inference_mode():
+        for im in images:
+            calibrator(im)  # observers record activation ranges
+    return convert(model, inplace=True)
+
+
+def load_targets(paths, images, reference=None, conf=0.5):
+    # Returns per image an (n, 5) tensor of class, x1, y1, x2, y2 in pixels: the YOLO labels of the image if there
+    # are any, otherwise the detections of reference (an AutoShape model) with a confidence >= conf
+    targets, labelled = [], 0
+    for path, im, label in zip(paths, images, img2label_paths(paths)):
+        if os.path.isfile(label):
+            lb = torch.tensor(np.loadtxt(label, ndmin=2), dtype=torch.float32).reshape(-1, 5)
+            lb[:, 1:] = xywhn2xyxy(lb[:, 1:], w=im.shape[1], h=im.shape[0])
+            targets.append(lb)
+            labelled += 1
+        else:
+            assert reference is not None, f'No labels for {path}'
+            pred = reference(im).pred[0].float().cpu()
+            pred = pred[pred[:, 4] >= conf]
+            targets.append(torch.cat((pred[:, 5:6], pred[:, :4]), 1))
+    LOGGER.info(f'{labelled}/{len(paths)} images labelled, the others use fp32 detections with conf >= {conf}')
+    return targets
+
+
+def match_predictions(pred, labels, iouv):
+    # Returns a (n_pred, n_iou) bool array, True where a prediction matches an unmatched same-class label at that IoU
+    correct = np.zeros((pred.shape[0], iouv.shape[0]), dtype=bool)
+    if not len(pred) or not len(labels):
+        return correct
+    iou = box_iou(labels[:, 1:], pred[:, :4])
+    correct_class = labels[:, 0:1] == pred[:, 5]
+    for i in range(len(iouv)):
+        x = torch.where((iou >= iouv[i]) & correct_class)  # IoU > threshold and classes match
+        if x[0].shape[0]:
+            matches = torch.cat((torch.stack(x, 1), iou[x[0], x[1]][:, None]), 1).numpy()  # [label, detect, iou]
+            if x[0].shape[0] > 1:
+                matches = matches[matches[:, 2].argsort()[::-1]]
+                matches = matches[np.unique(matches[:, 1], return_index=True)[1]]
+                matches = matches[np.unique(matches[:, 0], return_index=True)[1]]
+            correct[matches[:, 1].astype(int), i] = True
+    return correct
+
+
+def evaluate(model, images, targets, conf=0.001):
+    # Returns mAP@0.5, mAP@0.5:0.95 and mean latency (s) of an AutoShape model on images against targets
+    iouv = torch.linspace(0.5, 0.95, 10)
+    model.conf = conf
+    stats, times = [], []
+    for im, labels in zip(images, targets):
+        start = time.perf_counter()
+        pred = model(im).pred[0].float().cpu()
+        times.append(time.perf_counter() - start)
+        stats.append((match_predictions(pred, labels, iouv), pred[:, 4].numpy(), pred[:, 5].numpy(),
+                      labels[:, 0].numpy()))
+    tp, scores, pred_cls, target_cls = (np.concatenate(x, 0) for x in zip(*stats))
+    if not len(target_cls):
+        return 0.0, 0.0, float(np.mean(times))
+    _, _, _, _, _, ap, _ = ap_per_class(tp, scores, pred_cls, target_cls, names=model.names)
+    return float(ap[:, 0].mean()), float(ap.mean()), float(np.mean(times))
+
+
+@smart_inference_mode()
+def run(weights='Week_9.pt', calib='uploads', val=None, imgsz=(480, 640), engine=None, n_calib=64, max_drop=0.01,
+        ref_conf=0.5, out=None):
+    prefix = colorstr('Quantize:')
+    engine = engine or torch.backends.quantized.engine
+    assert engine in torch.backends.quantized.supported_engines, f'Unsupported quantized engine {engine}'
+    imgsz = [imgsz] if isinstance(imgsz, int) else list(imgsz)
+    imgsz *= 2 if len(imgsz) == 1 else 1  # expand
+    out = Path(out or Path(weights).with_name(f'{Path(weights).stem}_int8.torchscript'))
+
+    model = attempt_load(weights, device=torch.device('cpu'), inplace=True, fuse=True)  # FP32, Conv+BN fused
+    _, calib_images = load_images(calib, n_calib)
+    if val is None:
+        LOGGER.warning(f'WARNING ⚠️ {prefix} no --val folder, evaluating on the calibration images is optimistic')
+    val_paths, val_images = load_images(val or calib)
+
+    LOGGER.info(f'{prefix} calibrating on {len(calib_images)} images from {calib} ({engine} engine)...')
+    qmodel = quantize_static(model, calib_images, engine)
+
+    fp32, int8 = AutoShape(model, verbose=False), AutoShape(qmodel, verbose=False)
+    targets = load_targets(val_paths, val_images, reference=fp32, conf=ref_conf)
+    if not sum(len(t) for t in targets):
+        LOGGER.error(f'{prefix} no labels or fp32 detections in {val or calib} to evaluate on, {out} not written')
+        return None
+    results = {name: evaluate(m, val_images, targets) for name, m in (('fp32', fp32), ('int8', int8))}
+    for name, (map50, map50_95, t) in results.items():
+        LOGGER.info(f'{prefix} {name}: mAP@0.5 {map50:.4f}, mAP@0.5:0.95 {map50_95:.4f}, {t * 1000:.1f} ms/image')
+    drop = results['fp32'][0] - results['int8'][0]
+    if drop > max_drop:
+        LOGGER.error(f'{prefix} mAP@0.5 drops by {drop:.4f} > --max-drop {max_drop}, {out} not written')
+        return None
+
+    im = torch.zeros(1, 3, *imgsz)
+    return export_torchscript(qmodel, im, out, metadata={'precision': 'int8', 'engine': engine}, prefix=prefix)
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', type=str, default='Week_9.pt', help='model.pt path')
+    parser.add_argument('--calib', type=str, default='uploads', help='folder of calibration images (Pi captures)')
+    parser.add_argument('--val', type=str, default=None, help='folder of validation images, YOLO labels optional')
+    parser.add_argument('--imgsz', '--img', '--img-size', nargs='+', type=int, default=[480, 640], help='image (h, w)')
+    parser.add_argument('--engine', type=str, default=None, help='quantized engine: x86, fbgemm, qnnpack (ARM)')
+    parser.add_argument('--n-calib', type=int, default=64, help='number of calibration images')
+    parser.add_argument('--max-drop', type=float, default=0.01, help='largest mAP@0.5 drop allowed')
+    parser.add_argument('--ref-conf', type=float, default=0.5, help='confidence of fp32 detections used as labels')
+    parser.add_argument('--out', type=str, default=None, help='output path, <weights>_int8.torchscript by default')
+    opt = parser.parse_args()
+    return opt
+
+
+if __name__ == '__main__':
+    sys.exit(0 if run(**vars(parse_opt())) else 1)
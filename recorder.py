@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+# /path fields kept in the recording, anything else in the body is dropped
+PATH_FIELDS = ('robot_x', 'robot_y', 'robot_dir', 'retrying', 'stats', 'optimize', 'max_distance', 'cell_size', 'width',
+               'height')
+OBSTACLE_FIELDS = ('x', 'y', 'id', 'd')
+
+
+class RequestRecorder:
+    """
+    Appends sanitised /path and /image requests to a JSONL log so they can be replayed with bench/replay.py.
+
+    Uploaded image bytes go to `<directory>/blobs/<sha1><ext>` (stored once per content) and the log only
+    keeps the blob name, so the log stays small and diffable.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.log_path = os.path.join(directory, 'requests.jsonl')
+        self.blob_dir = os.path.join(directory, 'blobs')
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _append(self, record: dict):
+        record["ts"] = time.time()
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            with open(self.log_path, 'a') as f:
+                f.write(line)
+
+    def record_path(self, content: dict, endpoint: str = '/path'):
+        """Records a /path (or /path/stream) request body
+
+        Args:
+            content: /path request body
+            endpoint: Endpoint the body was sent to
+        """
+        body = {key: content[key] for key in PATH_FIELDS if key in content}
+        body['obstacles'] = [
+            {key: ob[key] for key in OBSTACLE_FIELDS if key in ob}
+            for ob in content.get('obstacles', []) if isinstance(ob, dict)
+        ]
+        self._append({"endpoint": endpoint, "json": body})
+
+    def record_image(self, filename: str, data: bytes):
+        """Records an /image upload
+
+        Args:
+            filename: Uploaded file name, <timestamp>_<obstacle_id>_<signal>.jpg
+            data: Uploaded file bytes
+        """
+        # Only the base name is kept, the Pi should never send a path
+        filename = os.path.basename(filename)
+        digest = hashlib.sha1(data).hexdigest()
+        blob = digest + (os.path.splitext(filename)[1] or '.jpg')
+        blob_path = os.path.join(self.blob_dir, blob)
+        if not os.path.exists(blob_path):
+            # Written to a temporary file then renamed, so a crash never leaves a truncated blob to replay
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.blob_dir)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, blob_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        self._append({"endpoint": "/image", "filename": filename, "blob": blob})
+
+
+def load_records(directory: str) -> list:
+    """Loads the records of a RequestRecorder directory
+
+    Args:
+        directory: RequestRecorder directory
+
+    Returns:
+        list: records in the order they were recorded
+    """
+    with open(os.path.join(directory, 'requests.jsonl')) as f:
+        return [json.loads(line) for line in f if line.strip()]
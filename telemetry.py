@@ -0,0 +1,67 @@
+import threading
+from bisect import bisect_left
+
+# Upper bounds of the histogram buckets, in seconds for timings and in units for counters
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+class Histogram:
+    """Fixed-bucket histogram, each bucket counts the observations <= its upper bound"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        # Last slot is the overflow (+Inf) bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self) -> dict:
+        """Returns the cumulative bucket counts, as in Prometheus histograms"""
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {"buckets": buckets, "count": self.count, "sum": self.sum}
+
+
+class SolverMetrics:
+    """Thread-safe aggregation of per-solve stats into one histogram per stat"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.solves = 0
+        self.histograms = dict()
+
+    def observe(self, stats: dict, timings: dict = None):
+        """Records the stats of one solve
+
+        Args:
+            stats: Numeric solver stats, keys starting with 'time_' are timings in seconds
+            timings: Request-level timings in seconds, recorded as 'time_<key>'
+        """
+        values = dict(stats)
+        for key, value in (timings or {}).items():
+            values[f"time_{key}"] = value
+
+        with self._lock:
+            self.solves += 1
+            for key, value in values.items():
+                if not isinstance(value, (int, float)):
+                    continue
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(TIME_BUCKETS if key.startswith("time_") else COUNT_BUCKETS)
+                self.histograms[key].observe(value)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "solves": self.solves,
+                "histograms": {key: hist.to_dict() for key, hist in sorted(self.histograms.items())},
+            }
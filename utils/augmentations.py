@@ -141,6 +141,24 @@ def letterbox(im, new_shape=(640, 640), color=(114, 114, 114), auto=True, scaleF
     return im, ratio, (dw, dh)
 
 
+def letterbox_into(im, out, color=(114, 114, 114)):
+    # Resize and pad im into the preallocated HWC array out, same pixels as letterbox(im, out.shape[:2], auto=False)
+    shape, new_shape = im.shape[:2], out.shape[:2]  # [height, width]
+    r = min(new_shape[0] / shape[0], new_shape[1] / shape[1])  # scale ratio (new / old)
+    new_unpad = int(round(shape[1] * r)), int(round(shape[0] * r))
+    top = int(round((new_shape[0] - new_unpad[1]) / 2 - 0.1))
+    left = int(round((new_shape[1] - new_unpad[0]) / 2 - 0.1))
+    bottom, right = top + new_unpad[1], left + new_unpad[0]
+
+    out[:top], out[bottom:] = color, color  # border
+    out[top:bottom, :left], out[top:bottom, right:] = color, color
+    if shape[::-1] != new_unpad:  # resize straight into out
+        cv2.resize(im, new_unpad, dst=out[top:bottom, left:right], interpolation=cv2.INTER_LINEAR)
+    else:
+        out[top:bottom, left:right] = im
+    return out
+
+
 def random_perspective(im,
                        targets=(),
                        segments=(),
@@ -141,6 +141,65 @@ def select_device(device='', batch_size=0, newline=True):
     return torch.device(arg)
 
 
+PRECISIONS = 'auto', 'fp32', 'bf16', 'fp16'  # inference precision policies, int8 models come from quantize.py
+
+
+def cpu_supports_bf16():
+    # True if the CPU runs bfloat16 natively (AVX512-BF16 / AMX), otherwise oneDNN emulates it
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def select_precision(device, precision='auto'):
+    # Returns the precision to run inference in on device, one of PRECISIONS except 'auto'
+    #   auto:         fp16 on CUDA, fp32 elsewhere (fp16 convolutions are emulated on CPU and much slower than fp32)
+    #   bf16:         native bfloat16 CPUs only, otherwise fp32. Faster than fp32 on AMX CPUs, boxes off by up to ~2 px
+    if precision == 'int8-dynamic':  # YOLOv5 has no Linear/LSTM layers for dynamic quantization to convert
+        raise ValueError('int8-dynamic quantizes nothing in YOLOv5 and is not supported, serve the int8 TorchScript '
+                         'export of quantize.py instead (MDP_WEIGHTS=Week_9_int8.torchscript)')
+    assert precision in PRECISIONS, f'Invalid precision {precision}, valid precisions are {PRECISIONS}'
+    device = torch.device(device)
+    cuda = device.type == 'cuda'
+    if precision == 'auto':
+        return 'fp16' if cuda else 'fp32'
+    if precision == 'bf16' and device.type == 'cpu' and not cpu_supports_bf16():
+        LOGGER.warning('WARNING ⚠️ bf16 is not supported natively by this CPU, using fp32')
+        return 'fp32'
+    if precision == 'fp16' and device.type == 'cpu':
+        LOGGER.warning('WARNING ⚠️ fp16 is emulated on CPU and usually slower than fp32')
+    return precision
+
+
+def apply_precision(model, precision):
+    # Converts a model to precision (see select_precision), returns the model and the dtype its inputs must have
+    dtype = {'fp16': torch.float16, 'bf16': torch.bfloat16}.get(precision, torch.float32)
+    return model.to(dtype), dtype
+
+
+def to_channels_last(model):
+    # Stores the Conv2d weights of model channels_last (NHWC), for oneDNN convolutions without layout reorders.
+    # Module-wide model.to(memory_format=...) fails on the 1-D Detect tensors that BaseModel._apply converts
+    for m in model.modules():
+        if isinstance(m, nn.Conv2d):
+            m.to(memory_format=torch.channels_last)
+    return model
+
+
+def configure_threads(threads=None, interop_threads=None):
+    # Sets the torch intra-op (within an operator) and inter-op thread counts, None keeps the default (physical cores).
+    # Returns the counts in use. Inter-op threads can only be set once, before any inter-op parallel work
+    if threads:
+        torch.set_num_threads(threads)
+    if interop_threads and interop_threads != torch.get_num_interop_threads():
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            LOGGER.warning(f'WARNING ⚠️ inter-op threads not set: {e}')
+    return torch.get_num_threads(), torch.get_num_interop_threads()
+
+
 def time_sync():
     # PyTorch-accurate time
     if torch.cuda.is_available():
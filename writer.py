@@ -0,0 +1,82 @@
+import atexit
+import queue
+import threading
+import traceback
+
+# Jobs waiting to be written before submit() blocks the caller
+DEFAULT_MAX_PENDING = 16
+
+
+class BackgroundWriter:
+    """
+    Runs disk writes (uploads, result images, annotated images) on a worker thread, off the request path.
+
+    Jobs are kept in a bounded queue: when max_pending jobs are waiting, submit() blocks until the worker catches
+    up, so a slow disk slows requests down instead of growing memory without bound. A job takes ownership of the
+    objects passed to it; the caller must not modify them afterwards. With a single worker, jobs run in order.
+    close() (also run at exit) writes everything still queued before returning.
+    """
+
+    def __init__(self, max_pending: int = DEFAULT_MAX_PENDING, workers: int = 1, name: str = "writer"):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.written = 0
+        self.failed = 0
+        self.blocked = 0
+        self._threads = [threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True) for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+        atexit.register(self.close)
+
+    def submit(self, fn, *args, **kwargs):
+        """Queues fn(*args, **kwargs), blocking while the queue is full
+
+        Runs fn in the caller's thread if the writer is closed, so nothing is lost during shutdown.
+        """
+        if self._closed:
+            fn(*args, **kwargs)
+            return
+        try:
+            self._queue.put_nowait((fn, args, kwargs))
+        except queue.Full:
+            with self._lock:
+                self.blocked += 1
+            self._queue.put((fn, args, kwargs))
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                fn, args, kwargs = job
+                fn(*args, **kwargs)
+                with self._lock:
+                    self.written += 1
+            except Exception:
+                with self._lock:
+                    self.failed += 1
+                traceback.print_exc()
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Blocks until every job submitted so far has run"""
+        self._queue.join()
+
+    def close(self):
+        """Runs the queued jobs and stops the workers; later jobs run in the caller's thread"""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def stats(self) -> dict:
+        """Jobs pending, written and failed, and how many submits had to wait for a full queue"""
+        with self._lock:
+            return {"pending": self._queue.qsize(), "written": self.written, "failed": self.failed,
+                    "blocked": self.blocked}